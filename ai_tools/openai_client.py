@@ -1,37 +1,205 @@
 import os
+import asyncio
 from typing import Optional, Tuple
 from pathlib import Path
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+import httpx
 from dotenv import load_dotenv
 import yaml
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    # PyYAML built without libyaml
+    from yaml import SafeLoader as YamlLoader
 import re
 import json
-import subprocess
+import sys
 import pickle
 import ast
-
-OPENAI_MODEL = "gpt-4.1"
-# "gpt-4.1"
-
+import copy
+import functools
+from collections import OrderedDict
+import io
+import tempfile
+from .openai_requests import OpenAIRequestsMixin, DETERMINISTIC_SAMPLING, DECIPHER_CACHE_FIELDS, json_loads
+from .prompts import (
+    PromptFileDumper, yaml_dump, dedent_prompt_text, render_prompt_prefix,
+    SYSTEM_MESSAGE_COMBINED_DECIPHER, SYSTEM_MESSAGE_DECIPHER_GENERATION, SYSTEM_MESSAGE_TEST_STEP,
+    SYSTEM_MESSAGE_PROMPT_ANALYSIS, SYSTEM_MESSAGE_PYLINT_FIX, SYSTEM_MESSAGE_PROMPT_FORMAT
+)
 
 MAX_ATTEMPTS = 7
 
-class OpenAIClient:
-    def __init__(self, api_key: Optional[str] = None):
+# Default maximal number of OpenAI requests in flight at once
+MAX_CONCURRENT_REQUESTS = 8
+
+# How long an idle connection to OpenAI is kept open. Requests are often separated by unit test runs
+# and user input, longer than httpx's 5 seconds default, and reconnecting costs a TLS handshake.
+HTTP_KEEPALIVE_EXPIRY_SECONDS = 120
+
+# Give up on pylint fixes after this many attempts in a row without fewer issues
+MAX_STALLED_PYLINT_ATTEMPTS = 2
+
+# Matches a single line module level expected_output assignment in a generated unit test
+EXPECTED_OUTPUT_PATTERN = re.compile(r'^expected_output\s*=\s*(.+)$', re.MULTILINE)
+
+# Matches a single pylint message line, e.g. "file.py:12:0: C0114: Missing module docstring"
+PYLINT_ISSUE_PATTERN = re.compile(r'^.+:\d+:\d+: [A-Z]\d{4}: ', re.MULTILINE)
+
+# Number of fixed deciphers sampled at once after a failed unit test, and their sampling temperature
+FIX_SAMPLES = 3
+FIX_SAMPLING_TEMPERATURE = 0.3
+
+# Matches the number of a suggested answer typed as a clarification
+ANSWER_NUMBER_PATTERN = re.compile(r"\s*(\d+)\s*")
+
+# Matches the explanation of one step in a bulk test steps response, e.g. "<step_2>...</step_2>"
+STEP_EXPLANATION_PATTERN = re.compile(r"<step_(\d+)>(.*?)</step_\1>", re.DOTALL)
+
+# Section markers of a decipher generation response, and of the combined response also holding the CLI command
+DECIPHER_MARKERS = ("# decipher.py", "# unit_test.py", "# explanation")
+COMBINED_DECIPHER_MARKERS = ("# cli_command",) + DECIPHER_MARKERS
+# Section markers of a pylint fix response
+PYLINT_FIX_MARKERS = ("# fixed_code", "# explanation")
+
+# Class name prefix used by the combined prompt, replaced once the CLI command is known
+DECIPHER_CLASS_PLACEHOLDER = "Placeholder"
+
+# Characters replaced by underscores in folder names: < > : " | ? * \ / plus brackets, hyphens and other problematic ones
+ILLEGAL_FOLDER_NAME_CHARS = '<>:"|?*\\/#[](){}@!$%^&+=;,\'`~-'
+FOLDER_NAME_TRANSLATION = str.maketrans(ILLEGAL_FOLDER_NAME_CHARS, '_' * len(ILLEGAL_FOLDER_NAME_CHARS))
+UNDERSCORES_PATTERN = re.compile(r'_+')
+
+
+def _find_closing_brace(text: str, start: int) -> Optional[int]:
+    """
+    Find the brace closing the one at the start index in linear time, skipping braces in quoted strings
+    and comments.
+
+    Args:
+        text (str): Python source
+        start (int): Index of the opening brace
+
+    Returns:
+        Optional[int]: Index of the closing brace, None if the braces aren't balanced
+    """
+    depth = 0
+    # Delimiter of the string being skipped: ', ", ''' or """
+    quote = None
+    index = start
+    while index < len(text):
+        char = text[index]
+        if quote:
+            if char == "\\":
+                # Skip the escaped character
+                index += 1
+            elif text.startswith(quote, index):
+                index += len(quote) - 1
+                quote = None
+        elif char == "#":
+            # A comment may hold an apostrophe or a brace, skip it up to the end of its line
+            index = text.find("\n", index)
+            if index < 0:
+                return None
+        elif char in "\"'":
+            quote = char * 3 if text.startswith(char * 3, index) else char
+            index += len(quote) - 1
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return index
+        index += 1
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _read_test_template(template_path: str) -> str:
+    """
+    Read the test template once per run.
+
+    Args:
+        template_path (str): Path to the test template
+
+    Returns:
+        str: The template content
+    """
+    with open(template_path, "r") as f:
+        return f.read()
+
+
+class OpenAIClient(OpenAIRequestsMixin):
+    # Root of the project, added to the Python path of the generated unit tests
+    PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+    def __init__(self, api_key: Optional[str] = None, max_concurrent: int = MAX_CONCURRENT_REQUESTS):
         """
         Initialize the OpenAI client.
         
         Args:
             api_key (Optional[str]): OpenAI API key. If not provided, will try to load from .env file
+            max_concurrent (int): Maximal number of concurrent OpenAI requests, keeps bursts under the rate limits
         """
         load_dotenv()
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OpenAI API key not found. Please provide it or set it in .env file")
         
-        self.client = OpenAI(api_key=self.api_key)
+        # Transient errors are retried with backoff by _chat_completion_async, not by the SDK
+        # One kept-alive connection per request allowed in flight
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=httpx.Limits(
+                max_connections=max_concurrent,
+                max_keepalive_connections=max_concurrent,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+            ))
+        )
+        # A single event loop drives all async calls, so the async client's connections stay bound to it
+        self._loop = asyncio.new_event_loop()
+        # Serializes decipher generation of steps sharing the same command folder
+        self._folder_locks = {}
+        # Decipher generations in flight, keyed by cache file, shared by identical steps
+        self._inflight_deciphers = {}
+        # Most recently used cached responses of this run, in front of the response cache files
+        self._recent_responses = OrderedDict()
+        # Bound the in-flight OpenAI requests, and separately the CPU bound pytest runs
+        self._llm_semaphore = asyncio.Semaphore(max_concurrent)
+        self._pytest_semaphore = asyncio.Semaphore(os.cpu_count() or 1)
+        # Environment of the pytest subprocesses, with the project root on the Python path
+        self._pytest_env = os.environ.copy()
+        if 'PYTHONPATH' in self._pytest_env:
+            self._pytest_env['PYTHONPATH'] = f"{self.PROJECT_ROOT}:{self._pytest_env['PYTHONPATH']}"
+        else:
+            self._pytest_env['PYTHONPATH'] = self.PROJECT_ROOT
+        # The unit tests only need plain pytest, skip discovering and importing the installed plugins on every run
+        self._pytest_env['PYTEST_DISABLE_PLUGIN_AUTOLOAD'] = '1'
         self.debug_mode = False  # Default to non-debug mode
-    
+
+    def _run_sync(self, coro):
+        """
+        Run a coroutine to completion on the client's event loop.
+
+        Args:
+            coro: Coroutine to run
+
+        Returns:
+            The coroutine result
+        """
+        return self._loop.run_until_complete(coro)
+
+    def close(self):
+        """
+        Close the kept-alive OpenAI connections and the client's event loop.
+        The client can't be used anymore afterwards.
+        """
+        if self._loop.is_closed():
+            return
+        self._run_sync(self.async_client.close())
+        self._loop.close()
+
     def sanitize_folder_name(self, name: str) -> str:
         """
         Sanitize a string to be used as a folder name by removing illegal characters.
@@ -42,29 +210,16 @@ class OpenAIClient:
         Returns:
             str: Sanitized folder name
         """
-        # Remove or replace illegal characters for folder names
-        # Illegal characters: < > : " | ? * \ / and control characters
-        # Also remove brackets, parentheses, hyphens, and other problematic characters
-        illegal_chars = r'[<>:"|?*\\/#\[\](){}@!$%^&+=;,\'`~-]'
-        
-        # Replace illegal characters with underscores
-        sanitized = re.sub(illegal_chars, '_', name)
-        
-        # Replace multiple consecutive underscores with single underscore
-        sanitized = re.sub(r'_+', '_', sanitized)
+        # Replace illegal characters with underscores in a single pass,
+        # then replace multiple consecutive underscores with single underscore
+        sanitized = UNDERSCORES_PATTERN.sub('_', name.translate(FOLDER_NAME_TRANSLATION))
         
-        # Replace spaces with underscores
-        sanitized = sanitized.replace(' ', '_')
+        # Replace spaces with underscores, remove leading and trailing underscores and dots, and convert to lowercase
+        sanitized = sanitized.replace(' ', '_').strip('_.').lower()
         
-        # Remove leading and trailing underscores and dots
-        sanitized = sanitized.strip('_.')
-        
-        # Convert to lowercase
-        sanitized = sanitized.lower()
-        
-        # Ensure it's not empty and doesn't start with a dot
-        if not sanitized or sanitized.startswith('.'):
-            sanitized = 'folder_' + sanitized.lstrip('.')
+        # Ensure it's not empty (stripping already guarantees it doesn't start with a dot)
+        if not sanitized:
+            sanitized = 'folder_'
         
         # Limit length to avoid filesystem issues
         if len(sanitized) > 200:
@@ -82,93 +237,96 @@ class OpenAIClient:
         Returns:
             Tuple[int, str]: (exit_code, output)
         """
-        # Add the project root to Python path
-        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-        env = os.environ.copy()
-        if 'PYTHONPATH' in env:
-            env['PYTHONPATH'] = f"{project_root}:{env['PYTHONPATH']}"
-        else:
-            env['PYTHONPATH'] = project_root
-
-        # Run pytest in a subprocess
-        result = subprocess.run(
-            ["pytest", str(test_file), "-vv"],
-            capture_output=True,
-            text=True,
-            env=env
-        )
-        
-        return result.returncode, result.stdout + result.stderr
+        return self._run_sync(self.run_pytest_async(test_file))
 
-    def _create_messages(self, system_content: str, user_content: str) -> list[dict]:
-        """Create properly typed messages for OpenAI chat completion."""
+    async def run_pytest_async(self, test_file: str) -> Tuple[int, str]:
+        """
+        Run pytest in a subprocess without blocking the event loop, at most one run per CPU at once.
+
+        Args:
+            test_file (str): Path to the test file
+
+        Returns:
+            Tuple[int, str]: (exit_code, output)
+        """
+        # Stop at the first failure. Verbose output is kept since failures are fed back to OpenAI,
+        # but the cache and header are skipped.
+        async with self._pytest_semaphore:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "pytest", str(test_file), "-vv", "-x", "-p", "no:cacheprovider", "--no-header",
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                env=self._pytest_env
+            )
+            try:
+                output, _ = await process.communicate()
+            except asyncio.CancelledError:
+                # Don't leave the unit test running after its decipher generation was cancelled
+                process.kill()
+                await process.wait()
+                raise
+
+        return process.returncode, output.decode(errors="replace")
+
+    def _create_messages(self, system_message: dict, user_content: str) -> list[dict]:
+        """Create properly typed messages for OpenAI chat completion, starting with a shared SYSTEM_MESSAGE_* constant."""
         return [
-            {"role": "system", "content": system_content},
+            system_message,
             {"role": "user", "content": user_content}
         ]
 
     def create_decipher(self, step: dict, test_folder_path: str) -> dict:
-        prompt = self._create_structured_prompt(
-            role="Python network automation expert specializing in CLI command parsing and testing",
-            task="""Extract the CLI command from the provided step details.
-Understand which parts of the extracted command represent dynamic or variable parameters according to the test needs
-For each identified dynamic value, replace its specific instance in the command with a descriptive, uppercase with underscores parameter name.
-If the "Step Details" hint at the purpose of the parameter, incorporate that into the name (e.g., SOURCE_IP_ADDRESS, DESTINATION_PORT).
-""",
-            requirements=[
-                "MUST return only the CLI command text",
-                "MUST NOT include any explanations or additional text",
-                "MUST extract the exact command that needs to be executed",
-                "MUST for each identified dynamic value, replace its specific instance in the command with a descriptive, uppercase parameter name."
-            ],
-            context={
-                "step_details": step[step["description_key"]],
-                "clarifications": yaml.dump(step.get('clarifications', {}), default_flow_style=False)
-            }
-        )
+        """
+        Create a decipher for a step, blocking until it is generated and validated.
 
-        messages = self._create_messages(
-            "You are a Python network automation expert specializing in CLI command parsing and testing.",
-            prompt
-        )
+        Args:
+            step (dict): Step definition containing a CLI output example
+            test_folder_path (str): Path to the test folder
 
-        print(f"Sending prompt to OpenAI to extract CLI command...")
-        self._save_messages(messages)
-        response = self.client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=messages,
-            temperature=0.1
-        )
+        Returns:
+            dict: The step updated with the decipher information
+        """
+        return self._run_sync(self.create_decipher_async(step, test_folder_path))
+
+    async def create_decipher_async(self, step: dict, test_folder_path: str) -> dict:
+        # Deciphers are deterministic given the step content, reuse a cached one if available
+        cache_file = self._get_decipher_cache_file(step)
+        if self._load_cached_decipher(cache_file, step, test_folder_path):
+            return step
+
+        # Identical steps processed concurrently share a single generation
+        task = self._inflight_deciphers.get(cache_file)
+        if task is None:
+            task = asyncio.ensure_future(self._create_decipher_uncached(step, test_folder_path, cache_file))
+            self._inflight_deciphers[cache_file] = task
+            task.add_done_callback(lambda _: self._inflight_deciphers.pop(cache_file, None))
+            return await task
+
+        print("Waiting for the decipher of an identical step in progress...")
+        decipher = await task
+        # Copy the result so later mutations of one step don't leak into the other
+        step.update(copy.deepcopy({field: decipher[field] for field in DECIPHER_CACHE_FIELDS if field in decipher}))
+        return step
 
-        # Extract code from response
-        content = response.choices[0].message.content
-        if not content:
-            raise ValueError("OpenAI returned empty response for CLI command extraction")
-        print(f"Received response from OpenAI: {content}")
-        cli_command = content.strip()
+    def _set_decipher_names(self, step: dict, cli_command: str, test_folder_path: str) -> str:
+        """
+        Derive the command folder, decipher class name and import path from the extracted CLI command.
+
+        Args:
+            step (dict): Step definition to update
+            cli_command (str): Extracted CLI command
+            test_folder_path (str): Path to the test folder
+
+        Returns:
+            str: Path to the command folder holding the decipher files
+        """
         step["cli_command"] = cli_command
         
-        # Create folder name from CLI command if available, otherwise use decipher_id
+        # Create folder name from CLI command
         folder_name = self.sanitize_folder_name(cli_command)
         command_folder = os.path.join(test_folder_path, folder_name)
         os.makedirs(command_folder, exist_ok=True)
 
-        # Create pickle filename based on decipher_id for caching in the command folder
-        decipher_id = step.get("decipher_id", "unknown_decipher")
-        # decipher_pickle_file = os.path.join(command_folder, f"{decipher_id}.pkl")
-        
-        # # Check if cached decipher exists in the command folder
-        # if os.path.exists(decipher_pickle_file):
-        #     print(f"Loading cached decipher from {decipher_pickle_file}")
-        #     try:
-        #         with open(decipher_pickle_file, "rb") as f:
-        #             cached_step = pickle.load(f)
-        #         print(f"Successfully loaded cached decipher: {cached_step.get('class_name', 'Unknown')}")
-        #         return cached_step
-        #     except Exception as e:
-        #         print(f"Failed to load cached decipher from {decipher_pickle_file}: {e}")
-        #         print("Proceeding with fresh decipher generation...")
-
         class_name = ''.join(word.capitalize() for word in folder_name.split('_'))
         step["class_name"] = f"{class_name}Decipher"
         
@@ -177,32 +335,172 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
         import_path = relative_path.replace(os.path.sep, '.')
         step["import_path"] = f"{import_path}.decipher"
 
+        return command_folder
+
+    async def _create_decipher_uncached(self, step: dict, test_folder_path: str, cache_file: str) -> dict:
+        """
+        Extract the CLI command of a step and generate its decipher, both with a single request.
+
+        Args:
+            step (dict): Step definition containing a CLI output example
+            test_folder_path (str): Path to the test folder
+            cache_file (str): Path where the validated decipher step is cached
+
+        Returns:
+            dict: The step updated with the decipher information
+        """
+        messages = self._build_combined_decipher_messages(step)
+
+        attempt = 0
+        sections = None
+        while sections is None and attempt < MAX_ATTEMPTS:
+            print(f"Sending prompt to OpenAI to extract CLI command and generate decipher... Attempt {attempt + 1} of {MAX_ATTEMPTS}")
+            self._save_messages(messages)
+            attempt += 1
+            content = await self._stream_chat_completion_async(messages, "# cli_command")
+            print("Received response from OpenAI")
+            if not content:
+                missing_marker = "# cli_command"
+            else:
+                sections, missing_marker = self._split_response_sections(content, COMBINED_DECIPHER_MARKERS)
+            if missing_marker:
+                messages.append({
+                    "role": "user",
+                    "content": f"Your response is missing the '{missing_marker}' marker. Please provide the response in the correct format with all required sections: # cli_command, # decipher.py, # unit_test.py, and # explanation."
+                })
+
+        if sections is None:
+            raise ValueError("OpenAI did not return a well formed CLI command and decipher response")
+
+        cli_command, decipher_code, unit_test_code, explanation = sections
+        print(f"Extracted CLI command: {cli_command}")
+        print("\nImplementation Explanation:")
+        print("=" * 80)
+        print(explanation)
+        print("=" * 80)
+        command_folder = self._set_decipher_names(step, cli_command, test_folder_path)
+
+        # Steps extracting the same command share its folder, generate their deciphers one at a time
+        folder_lock = self._folder_locks.setdefault(command_folder, asyncio.Lock())
+        placeholder_class_name = f"{DECIPHER_CLASS_PLACEHOLDER}Decipher"
+        generated_files = (
+            decipher_code.replace(placeholder_class_name, step["class_name"]),
+            unit_test_code.replace(placeholder_class_name, step["class_name"])
+        )
+        async with folder_lock:
+            decipher_file = os.path.join(command_folder, "decipher.py")
+            unit_test_file = os.path.join(command_folder, "unit_test.py")
+            # Existing files are tested first as before, the generated ones are their replacement if they fail
+            if not (os.path.exists(decipher_file) and os.path.exists(unit_test_file)):
+                with open(decipher_file, "w") as f:
+                    f.write(generated_files[0])
+                with open(unit_test_file, "w") as f:
+                    f.write(generated_files[1])
+                generated_files = None
+            return await self._generate_decipher_implementation(
+                step, command_folder, cache_file, attempt, generated_files
+            )
+
+    def _build_combined_decipher_messages(self, step: dict) -> list[dict]:
+        """
+        Build the messages asking OpenAI to extract the CLI command of a step and generate its decipher
+        and unit test in the same response. The decipher class is named with DECIPHER_CLASS_PLACEHOLDER,
+        as its name derives from the CLI command.
+
+        Args:
+            step (dict): Step definition containing a CLI output example
+
+        Returns:
+            list[dict]: Chat messages for the combined CLI command extraction and decipher generation
+        """
+        prompt = self._create_structured_prompt(
+            task=f"""First, extract the CLI command from the provided step details.
+Understand which parts of the extracted command represent dynamic or variable parameters according to the test needs
+For each identified dynamic value, replace its specific instance in the command with a descriptive, uppercase with underscores parameter name.
+If the step_details hint at the purpose of the parameter, incorporate that into the name (e.g., SOURCE_IP_ADDRESS, DESTINATION_PORT).
+
+Then, generate a decipher class and corresponding unit test to parse the output of this CLI command and extract relevant data for test automation. Deciphers (parsers) are responsible for converting string text from CLI responses into Python dictionaries.
+Assume that the provided CLI output examples are the full expected output from the command.
+Pay attention to the clarifications that might be provided below.
+""",
+            requirements=[
+                "MUST put only the CLI command text in the cli_command section, without explanations",
+                "MUST extract the exact command that needs to be executed",
+                "MUST for each identified dynamic value, replace its specific instance in the command with a descriptive, uppercase parameter name."
+            ] + self._decipher_requirements(DECIPHER_CLASS_PLACEHOLDER),
+            context={
+                "step_details": step[step["description_key"]],
+                "cli_output_example": step.get('cli_output_example', ''),
+                "clarifications": yaml_dump(step.get('clarifications', {}))
+            },
+            output_format="""
+# cli_command
+[CLI command text]
+
+# decipher.py
+[Python code for decipher.py]
+
+# unit_test.py
+[Python code for unit_test.py]
+
+# explanation
+[Short summary of implementation and design decisions]
+"""
+        )
+
+        return self._create_messages(SYSTEM_MESSAGE_COMBINED_DECIPHER, prompt)
+
+    def _decipher_requirements(self, class_name: str) -> list[str]:
+        """
+        Requirements of a generated decipher and its unit test.
+
+        Args:
+            class_name (str): Decipher class name, without the Decipher suffix
+
+        Returns:
+            list[str]: Prompt requirements
+        """
+        # The requirements naming the classes come last, to keep the shared prompt prefix long
+        return [
+            "MUST inherit from Decipher base class",
+            "MUST implement exactly: '@staticmethod def decipher(cli_response: str)'",
+            "MUST use pytest framework (not unittest)",
+            "MUST use underscores for JSON keys (not hyphens): 'command_output' not 'command-output'",
+            "MUST define expected_output at module level as single line variable with valid JSON string",
+            "MUST use relative imports in unit test: 'from decipher import {class_name}Decipher'",
+            "MUST import base class: 'from tests.base.decipher import Decipher'",
+            "MUST include CLI command in class docstring",
+            "MUST write directly executable Python code (no markdown/backticks)",
+            "MUST format both files with proper imports and docstrings",
+            "MUST validate decipher correctly parses the provided CLI output example",
+            f"MUST name the decipher class exactly '{class_name}Decipher' (CamelCase, no extra suffixes)",
+            f"MUST name unit test class exactly 'Test{class_name}Decipher'"
+        ]
+
+    def _build_decipher_generation_messages(self, step: dict) -> list[dict]:
+        """
+        Build the messages asking OpenAI to generate the decipher and its unit test.
+
+        Args:
+            step (dict): Step definition with the extracted CLI command and decipher class name
+
+        Returns:
+            list[dict]: Chat messages for the decipher generation
+        """
+        cli_command = step["cli_command"]
+        class_name = step["class_name"][:-len("Decipher")]
+
         # Generate initial implementation using structured prompt
         prompt = self._create_structured_prompt(
-            role="Python network automation expert specializing in CLI command parsing and testing",
             task=f"""Deciphers (parsers) are responsible for converting string text from CLI responses into Python dictionaries. Generate a decipher class named '{class_name}Decipher' and corresponding unit test to parse CLI command output and extract relevant data for test automation.\n\n{step[step['description_key']]}
             Assume that the provided CLI output examples are the full expected output from the command.
             Pay attention to the clarifications that might be provided below.
             """,
-            requirements=[
-                f"MUST name the decipher class exactly '{class_name}Decipher' (CamelCase, no extra suffixes)",
-                "MUST inherit from Decipher base class",
-                "MUST implement exactly: '@staticmethod def decipher(cli_response: str)'",
-                f"MUST name unit test class exactly 'Test{class_name}Decipher'",
-                "MUST use pytest framework (not unittest)",
-                "MUST use underscores for JSON keys (not hyphens): 'command_output' not 'command-output'",
-                "MUST define expected_output as single line variable with valid JSON string",
-                "MUST use relative imports in unit test: 'from decipher import {class_name}Decipher'",
-                "MUST import base class: 'from tests.base.decipher import Decipher'",
-                "MUST include CLI command in class docstring",
-                "MUST write directly executable Python code (no markdown/backticks)",
-                "MUST format both files with proper imports and docstrings",
-                "MUST validate decipher correctly parses the provided CLI output example"
-            ],
+            requirements=self._decipher_requirements(class_name),
             context={
                 "cli_command": cli_command,
                 "cli_output_example": step.get('cli_output_example', ''),
-                "clarifications": yaml.dump(step.get('clarifications', {}), default_flow_style=False)
+                "clarifications": yaml_dump(step.get('clarifications', {}))
             },
             output_format="""
 # decipher.py
@@ -216,12 +514,54 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
 """
         )
         
-        messages = [
-            {"role": "system", "content": "You are a Python network automation expert specializing in CLI command parsing and testing. You must respond with executable Python code and explanations in the specified format."},
-            {"role": "user", "content": prompt}
-        ]
+        return self._create_messages(SYSTEM_MESSAGE_DECIPHER_GENERATION, prompt)
+
+    def _split_response_sections(self, content: str, markers: tuple[str, ...] = DECIPHER_MARKERS) -> tuple[Optional[tuple[str, ...]], Optional[str]]:
+        """
+        Split a response into the sections opened by the given markers.
+
+        Args:
+            content (str): Response content
+            markers (tuple[str, ...]): Markers opening each section, in order
+
+        Returns:
+            tuple[Optional[tuple[str, ...]], Optional[str]]: (sections, missing_marker), e.g. ((decipher_code, unit_test_code, explanation), None).
+            The sections are None when a marker is missing, and the missing marker is None on success.
+        """
+        sections = []
+        remaining = content
+        for index, marker in enumerate(markers):
+            section, separator, remaining = remaining.partition(marker)
+            # Each marker must appear exactly once
+            if not separator or marker in remaining:
+                return None, marker
+            if index:
+                sections.append(section.strip())
+        sections.append(remaining.strip())
+
+        return tuple(sections), None
+
+    async def _generate_decipher_implementation(self, step: dict, command_folder: str, cache_file: str, attempt: int = 0,
+                                                generated_files: Optional[tuple[str, str]] = None) -> dict:
+        """
+        Generate the decipher and its unit test, retrying until the unit test passes.
+        Files already in the command folder are tested first and only regenerated on failure.
+
+        Args:
+            step (dict): Step definition with the extracted CLI command and decipher class name
+            command_folder (str): Folder where decipher.py and unit_test.py are written
+            cache_file (str): Path where the validated decipher step is cached
+            attempt (int): Number of generation attempts already spent on this decipher
+            generated_files (Optional[tuple[str, str]]): Decipher and unit test code already generated,
+                which replace the existing files if those fail, before any fix is requested
+
+        Returns:
+            dict: The step updated with the decipher information
+        """
+        messages = self._build_decipher_generation_messages(step)
+        # Feedback turns are appended after the generation prompt, only the latest round of them is kept
+        prompt_messages_count = len(messages)
 
-        attempt = 0
         fix_required = False
         
         decipher_file = os.path.join(command_folder, "decipher.py")
@@ -229,52 +569,50 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
         files_exist = os.path.exists(decipher_file) and os.path.exists(unit_test_file)
 
         while attempt < MAX_ATTEMPTS:
-            if not files_exist or fix_required:
+            # Unit test result of the sampled fixes, already run by _sample_decipher_fix
+            test_result = None
+            if fix_required and generated_files is not None:
+                # The generation was already paid for, test it before requesting a fix
+                print(f"\nExisting files in {command_folder} failed, testing the newly generated decipher")
+                decipher_code, unit_test_code = generated_files
+                generated_files = None
+                with open(decipher_file, "w") as f:
+                    f.write(decipher_code)
+                with open(unit_test_file, "w") as f:
+                    f.write(unit_test_code)
+            elif not files_exist or fix_required:
                 print(f"Sending prompt to OpenAI... Attempt {attempt + 1} of {MAX_ATTEMPTS}")
                 self._save_messages(messages)
-                response = self.client.chat.completions.create(
-                    model=OPENAI_MODEL,
-                    messages=messages,
-                    temperature=0.1
-                )
+                # Every generation consumes an attempt, including malformed responses retried below
+                attempt += 1
+                if fix_required:
+                    content, test_result = await self._sample_decipher_fix(messages, command_folder)
+                else:
+                    content = await self._stream_chat_completion_async(messages, "# decipher.py")
                 print("Received response from OpenAI")
-                # Extract code from response
-                content = response.choices[0].message.content
-                if not content:
-                    messages.append({
-                        "role": "user",
-                        "content": "OpenAI returned empty response. Please provide the response in the correct format with all required sections: # decipher.py, # unit_test.py, and # explanation."
-                    })
-                    continue
-                
-                # Split into files using the file markers
-                parts = content.split("# decipher.py")
-                if len(parts) != 2:
+                if content is None:
                     messages.append({
                         "role": "user",
-                        "content": "Your response is missing the '# decipher.py' marker. Please provide the response in the correct format with all required sections: # decipher.py, # unit_test.py, and # explanation."
+                        "content": "Your response must start with the '# decipher.py' marker. Please provide the response in the correct format with all required sections: # decipher.py, # unit_test.py, and # explanation."
                     })
                     continue
-                
-                decipher_part = parts[1].split("# unit_test.py")
-                if len(decipher_part) != 2:
+                if not content:
                     messages.append({
                         "role": "user",
-                        "content": "Your response is missing the '# unit_test.py' marker. Please provide the response in the correct format with all required sections: # decipher.py, # unit_test.py, and # explanation."
+                        "content": "OpenAI returned empty response. Please provide the response in the correct format with all required sections: # decipher.py, # unit_test.py, and # explanation."
                     })
                     continue
                 
-                unit_test_part = decipher_part[1].split("# explanation")
-                if len(unit_test_part) != 2:
+                # Split into files using the file markers
+                sections, missing_marker = self._split_response_sections(content)
+                if missing_marker:
                     messages.append({
                         "role": "user",
-                        "content": "Your response is missing the '# explanation' marker. Please provide the response in the correct format with all required sections: # decipher.py, # unit_test.py, and # explanation."
+                        "content": f"Your response is missing the '{missing_marker}' marker. Please provide the response in the correct format with all required sections: # decipher.py, # unit_test.py, and # explanation."
                     })
                     continue
                 
-                decipher_code = decipher_part[0].strip()
-                unit_test_code = unit_test_part[0].strip()
-                explanation = unit_test_part[1].strip()
+                decipher_code, unit_test_code, explanation = sections
                 
                 # Log the explanation
                 print("\nImplementation Explanation:")
@@ -294,8 +632,10 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
 
             # Verify the implementation
             try:
-                # Run pytest in a subprocess
-                exit_code, test_output = self.run_pytest(unit_test_file)
+                if test_result is None:
+                    exit_code, test_output = await self.run_pytest_async(unit_test_file)
+                else:
+                    exit_code, test_output = test_result
                 
                 if exit_code == 0:
                     print(f"\nTest {unit_test_file} PASSED")
@@ -317,49 +657,15 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
                         f.write(decipher_content)
                     # TEMPORARY
 
-                    # Extract expected_output using ast to safely parse Python assignments
-                    try:
-                        # Parse the entire file
-                        tree = ast.parse(test_content)
-                        
-                        # Look for assignment to expected_output
-                        for node in ast.walk(tree):
-                            if isinstance(node, ast.Assign):
-                                for target in node.targets:
-                                    if isinstance(target, ast.Name) and target.id == 'expected_output':
-                                        # Get the value being assigned
-                                        if isinstance(node.value, ast.Str):
-                                            # If it's a string literal, parse it as JSON
-                                            json_str = node.value.s
-                                        elif isinstance(node.value, ast.Dict):
-                                            # If it's a dictionary literal, convert to string
-                                            json_str = ast.literal_eval(node.value)
-                                        else:
-                                            continue
-                                        
-                                        try:
-                                            if isinstance(json_str, dict):
-                                                json_example = json_str
-                                            else:
-                                                json_example = json.loads(json_str)
-                                            step["json_example"] = json_example
-                                            break
-                                        except json.JSONDecodeError as e:
-                                            print(f"Warning: Could not parse JSON from expected_output in {unit_test_file}: {str(e)}")
-                                            print(f"Content: {json_str}")
-                                            
-                    except SyntaxError as e:
-                        print(f"Warning: Could not parse Python file {unit_test_file}: {str(e)}")
-                    except Exception as e:
-                        print(f"Warning: Error processing expected_output from {unit_test_file}: {str(e)}")
-                    
-                    # Cache the successfully created decipher for future use
-                    # try:
-                    #     with open(decipher_pickle_file, "wb") as f:
-                    #         pickle.dump(step, f)
-                    #     print(f"Successfully cached decipher to {decipher_pickle_file}")
-                    # except Exception as e:
-                    #     print(f"Warning: Failed to cache decipher to {decipher_pickle_file}: {e}")
+                    json_example = self._extract_json_example(test_content, unit_test_file)
+                    if json_example is not None:
+                        step["json_example"] = json_example
+
+                    # Cache the successfully created decipher for future runs
+                    self._save_cached_decipher(cache_file, step, {
+                        "decipher.py": decipher_content,
+                        "unit_test.py": test_content
+                    })
                     
                     return step
                 else:
@@ -378,7 +684,7 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
                 fix_required = True
 
             # If we got here, the test failed or had an error
-            if attempt < MAX_ATTEMPTS - 1:
+            if attempt < MAX_ATTEMPTS:
                 # Add the error context to the messages for the next attempt
                 if files_exist:
                     # If files exist, we need to read their content for the next attempt
@@ -391,6 +697,9 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
                     # If files were just generated, use the code we already have
                     content = f"# decipher.py\n{decipher_code}\n# unit_test.py\n{unit_test_code}"
                 
+                # The latest implementation and its errors supersede the previous attempts,
+                # so the prompt doesn't grow with every attempt
+                del messages[prompt_messages_count:]
                 messages.append({"role": "assistant", "content": content})
                 messages.append({
                     "role": "user",
@@ -400,7 +709,7 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
                     
                     Please provide a fixed version of both files that addresses these issues.
                     Keep the same class names and ensure the code is directly executable.
-                    Remember to define expected_output as a single line variable with a valid JSON string.
+                    Remember to define expected_output at module level as a single line variable with a valid JSON string.
                     
                     Requirements:
                     - The decipher class must be named '{step["class_name"]}'
@@ -412,7 +721,7 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
                     - Both files must be properly formatted with imports and docstrings
                     - The class docstring must include the CLI command being parsed
                     - The code must be production-ready and follow Python best practices
-                    - In the unit test, define the expected output as a single line variable named 'expected_output' with a valid JSON string
+                    - In the unit test, define the expected output at module level as a single line variable named 'expected_output' with a valid JSON string
                     - In the unit test file, use relative imports for importing the decipher class, without using the . before decipher. Example: 'from decipher import ShowIsisNeighborsIncRoleZDecipher'. Using . before decipher will cause ImportError.
                     - In the decipher file, import the base class using 'from tests.base.decipher import Decipher'
                     
@@ -421,12 +730,153 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
                     
                     """
                 })
-                attempt += 1
             else:
                 break
 
         return step
        
+    def _parse_json_example(self, value, unit_test_file: str) -> Optional[dict]:
+        """
+        Convert the value assigned to expected_output into the JSON example, with orjson when installed.
+
+        Args:
+            value: JSON string or dictionary assigned to expected_output
+            unit_test_file (str): Path to the unit test, for the warnings
+
+        Returns:
+            Optional[dict]: The JSON example, None if the string isn't valid JSON
+        """
+        if isinstance(value, dict):
+            return value
+        try:
+            return json_loads(value)
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError
+        except json.JSONDecodeError as e:
+            print(f"Warning: Could not parse JSON from expected_output in {unit_test_file}: {str(e)}")
+            print(f"Content: {value}")
+            return None
+
+    def _eval_expected_output_literal(self, test_content: str, match: re.Match) -> Optional[object]:
+        """
+        Evaluate the literal matched by EXPECTED_OUTPUT_PATTERN, taking a dictionary literal
+        spanning several lines up to its closing brace.
+
+        Args:
+            test_content (str): Content of the unit test
+            match (re.Match): Match of EXPECTED_OUTPUT_PATTERN in the content
+
+        Returns:
+            Optional[object]: The JSON string or dictionary, None if the literal isn't one of them
+        """
+        literal = match.group(1)
+        if literal.startswith("{"):
+            end = _find_closing_brace(test_content, match.start(1))
+            if end is not None:
+                literal = test_content[match.start(1):end + 1]
+        try:
+            value = ast.literal_eval(literal)
+        except (ValueError, SyntaxError):
+            # e.g. a string spanning several lines, evaluated from the parsed file
+            return None
+        return value if isinstance(value, (str, dict)) else None
+
+    def _extract_json_example(self, test_content: str, unit_test_file: str) -> Optional[dict]:
+        """
+        Extract the JSON example from the expected_output assignment of a unit test.
+
+        Args:
+            test_content (str): Content of the unit test
+            unit_test_file (str): Path to the unit test, for the warnings
+
+        Returns:
+            Optional[dict]: The JSON example, None if it couldn't be extracted
+        """
+        # Fast path: the literal of a module level assignment, evaluated on its own
+        match = EXPECTED_OUTPUT_PATTERN.search(test_content)
+        fast_path_value = self._eval_expected_output_literal(test_content, match) if match else None
+        fast_path_line = test_content.count("\n", 0, match.start()) + 1 if match else None
+
+        # Extract expected_output using ast to safely parse Python assignments
+        try:
+            # Parse the entire file
+            tree = ast.parse(test_content)
+            
+            # Look for the assignment to expected_output, ast.walk visits the module level ones first
+            # and then those nested in the test classes and functions
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Assign):
+                    for target in node.targets:
+                        if isinstance(target, ast.Name) and target.id == 'expected_output':
+                            # The regex also matches lines of docstrings, its literal is only used
+                            # once the parse confirms that it is this assignment
+                            if fast_path_value is not None and node.lineno == fast_path_line:
+                                json_example = self._parse_json_example(fast_path_value, unit_test_file)
+                            # Get the value being assigned
+                            elif isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+                                # If it's a string literal, parse it as JSON
+                                json_example = self._parse_json_example(node.value.value, unit_test_file)
+                            elif isinstance(node.value, ast.Dict):
+                                # If it's a dictionary literal, evaluate it
+                                json_example = self._parse_json_example(ast.literal_eval(node.value), unit_test_file)
+                            else:
+                                continue
+                            if json_example is not None:
+                                return json_example
+
+        except SyntaxError as e:
+            print(f"Warning: Could not parse Python file {unit_test_file}: {str(e)}")
+        except Exception as e:
+            print(f"Warning: Error processing expected_output from {unit_test_file}: {str(e)}")
+
+        return None
+
+    async def _sample_decipher_fix(self, messages: list[dict], command_folder: str) -> tuple[str, Optional[Tuple[int, str]]]:
+        """
+        Sample several fixed deciphers with a single request and run their unit tests concurrently,
+        so a flaky failure doesn't cost one sequential attempt per retry.
+
+        Args:
+            messages (list[dict]): Chat messages asking for the fix
+            command_folder (str): Folder of the decipher, holding the temporary variant folders
+
+        Returns:
+            tuple[str, Optional[Tuple[int, str]]]: (content, test_result). The content of the first variant passing
+            its unit test, or of the first well formed variant if none passes, with its unit test (exit_code, output)
+            as if run from the command folder. The test result is None if no variant is well formed.
+        """
+        response = await self._chat_completion_async(messages, temperature=FIX_SAMPLING_TEMPERATURE, n=FIX_SAMPLES)
+        contents = [choice.message.content or "" for choice in response.choices]
+        variants = [
+            (content, sections) for content in contents
+            if (sections := self._split_response_sections(content)[0]) is not None
+        ]
+        if not variants:
+            return contents[0], None
+
+        async def run_variant_test(variant_folder: str, sections: tuple[str, ...]) -> Tuple[int, str]:
+            decipher_code, unit_test_code, _ = sections
+            os.makedirs(variant_folder)
+            with open(os.path.join(variant_folder, "decipher.py"), "w") as f:
+                f.write(decipher_code)
+            with open(os.path.join(variant_folder, "unit_test.py"), "w") as f:
+                f.write(unit_test_code)
+            exit_code, output = await self.run_pytest_async(os.path.join(variant_folder, "unit_test.py"))
+            # The variant folder is removed, report the failures at the files the variant is written to
+            return exit_code, output.replace(variant_folder, command_folder)
+
+        with tempfile.TemporaryDirectory(dir=command_folder) as variants_folder:
+            test_results = await asyncio.gather(*(
+                run_variant_test(os.path.join(variants_folder, f"variant_{index}"), sections)
+                for index, (_, sections) in enumerate(variants)
+            ))
+
+        exit_codes = [exit_code for exit_code, _ in test_results]
+        print(f"{exit_codes.count(0)} of {len(variants)} sampled fixes passed their unit test")
+        for (content, _), test_result in zip(variants, test_results):
+            if test_result[0] == 0:
+                return content, test_result
+        return variants[0][0], test_results[0]
+
     def create_test_file(self, test_name: str, test_folder_path: str) -> tuple[str, str]:
         """
         Create a new test file from template with proper class and method names.
@@ -440,14 +890,13 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
             tuple[str, str]: Path to the test file and its content
         """
         test_file = os.path.join(test_folder_path, f"{test_name}.py")
-        if os.path.exists(test_file):
+        try:
             # Read existing file content
             with open(test_file, "r") as f:
                 template_content = f.read()
-        else:
+        except FileNotFoundError:
             # Read the template
-            with open("test_template.py", "r") as f:
-                template_content = f.read()
+            template_content = _read_test_template("test_template.py")
             
             # Convert test_name to camel case for class name
             class_name = ''.join(word.capitalize() for word in test_name.split('_'))
@@ -463,15 +912,24 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
         return test_file, template_content
 
     def _save_messages(self, messages: list[dict], file_name: str="last_prompt.txt"):
+        """
+        Save the messages of the next OpenAI request for review in debug mode.
+        Outside debug mode nothing is written, the requests are sent on every attempt and the
+        file would only hold the last of them.
+
+        Args:
+            messages (list[dict]): Chat messages about to be sent
+            file_name (str): File to write the messages to
+        """
+        if not self.debug_mode:
+            return
+
         with open(file_name, "w") as f:
-            for message in messages:
-                f.write(f"{message['role']}: {message['content']}\n")
+            f.writelines(f"{message['role']}: {message['content']}\n" for message in messages)
         
-        if hasattr(self, 'debug_mode') and self.debug_mode:
-            input("Prompt saved. Press Enter to continue after reviewing the saved messages...")
+        input("Prompt saved. Press Enter to continue after reviewing the saved messages...")
 
     def _create_structured_prompt(self, 
-                                 role: str,
                                  task: str, 
                                  requirements: list[str],
                                  context: Optional[dict] = None,
@@ -479,59 +937,33 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
                                  output_format: Optional[str] = None) -> str:
         """
         Create a well-structured prompt for AI that's easy to understand.
+        The role the AI should take is stated by the system message sent along with the prompt.
         
         Args:
-            role: The role the AI should take (e.g., "Python network automation expert")
             task: The main task description
             requirements: List of specific requirements
             context: Dictionary of context information (optional)
             examples: Example content (optional)  
             output_format: Expected output format (optional)
         """
-        sections = []
+        prompt = io.StringIO()
         
-        # Role definition
-        sections.append(f"You are a {role}.")
-        sections.append("")
+        # The sections shared by the calls of a prompt come first, so OpenAI's automatic prompt
+        # caching can reuse the common prefix, and they are rendered once per run.
+        # The task and context, which usually differ, come last.
+        prompt.write(render_prompt_prefix(tuple(requirements), examples, output_format))
         
-        # Main task
-        sections.append("## TASK")
-        sections.append(task)
-        sections.append("")
+        # Main task, without the indentation of its source code
+        prompt.write(f"## TASK\n{dedent_prompt_text(task)}\n\n")
         
-        # Context (if provided)
+        # Context (if provided), static entries such as code snippets should come first
         if context:
-            sections.append("## CONTEXT")
+            prompt.write("## CONTEXT\n")
             for key, value in context.items():
-                sections.append(f"### {key.replace('_', ' ').title()}")
-                sections.append(str(value))
-                sections.append("")
-        
-        # Requirements
-        if requirements:
-            sections.append("## REQUIREMENTS")
-            for i, req in enumerate(requirements, 1):
-                # Mark critical requirements
-                if any(keyword in req.lower() for keyword in ['must', 'critical', 'important', 'exactly']):
-                    sections.append(f"🔴 **CRITICAL {i}**: {req}")
-                else:
-                    sections.append(f"• {req}")
-            sections.append("")
-        
-        # Examples (if provided)
-        if examples:
-            sections.append("## EXAMPLES")
-            sections.append(examples)
-            sections.append("")
-        
-        # Output format (if provided)
-        if output_format:
-            sections.append("## OUTPUT FORMAT")
-            sections.append("⚠️ **IMPORTANT**: Your response must be in this exact format:")
-            sections.append(output_format)
-            sections.append("")
+                prompt.write(f"{key}:\n{value}\n\n")
         
-        return "\n".join(sections)
+        # Every section ends with an empty line, the prompt itself doesn't end with a line break
+        return prompt.getvalue()[:-1]
 
     def _get_decipher_info(self, step: dict, deciphers_map: dict) -> tuple[str, str, str]:
         """
@@ -549,16 +981,39 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
             if decipher:
                 cli_command = decipher['cli_command']
                 decipher_class_name = decipher['class_name']
-                decipher_info = f"""
-                Related Decipher Information:
-                - Import: from {decipher['import_path']} import {decipher_class_name}
-                - Decipher class name: {decipher_class_name}
-                - CLI Command: {cli_command}
-                - Expected Output Format: {yaml.dump(decipher.get('json_example', {}), default_flow_style=False)}
-                """
+                decipher_info = (
+                    "\nRelated Decipher Information:\n"
+                    f"- Import: from {decipher['import_path']} import {decipher_class_name}\n"
+                    f"- Decipher class name: {decipher_class_name}\n"
+                    f"- CLI Command: {cli_command}\n"
+                    f"- Expected Output Format:\n{yaml_dump(decipher.get('json_example', {}))}"
+                )
         
         return decipher_info, cli_command, decipher_class_name
 
+    async def _repair_test_step_response(self, content: str) -> tuple[Optional[str], Optional[str], bool]:
+        """
+        Ask OpenAI to reformat a test step response missing its markers. Only the response is sent,
+        not the test step prompt, so the repair costs about the size of the response.
+
+        Args:
+            content (str): The malformed response
+
+        Returns:
+            tuple[Optional[str], Optional[str], bool]: (new_file_content, explanation, success)
+        """
+        print("Asking OpenAI to repair the response format...")
+        messages = self._create_messages(
+            SYSTEM_MESSAGE_TEST_STEP,
+            "Reformat the following response without changing its code or explanation: start with a "
+            "'# new_file_content' line followed by the complete test file content, then an '# explanation' "
+            f"line followed by the explanation of the changes.\n\n{content}"
+        )
+        repaired = await self._stream_chat_completion_async(messages, "# new_file_content", echo_marker="# explanation")
+        if not repaired:
+            return None, None, False
+        return self._process_test_step_response(repaired)
+
     def _create_test_step_prompt(self, 
                                 zcode_snippets: str,
                                 test_file_content: str,
@@ -570,40 +1025,20 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
             "code_snippets": zcode_snippets,
             "current_test_file": test_file_content,
             "previous_steps": previous_steps_description,
-            "step_details": yaml.dump(step, default_flow_style=False),
+            "step_details": yaml_dump(step),
             "decipher_info": decipher_info
         }
         
         # Add clarifications if available
         if 'clarifications' in step:
-            context["clarifications"] = yaml.dump(step['clarifications'], default_flow_style=False)
+            context["clarifications"] = yaml_dump(step['clarifications'])
             
         return self._create_structured_prompt(
-            role="Python network automation expert specializing in test automation",
             task="""Implement a test step by updating the existing test file content. Add the implementation to the test method following the existing structure.
             Pay attention to the clarifications that might be provided below.
             If the step contains CLI command, use the decipher class to parse the output. Use the decipher output example from the provided decipher map, to understand the expected output format.
             """,
-            requirements=[
-                "MUST follow the existing test structure and patterns",
-                "MUST add clear comments explaining the implementation",
-                "MUST use the code snippets as reference for implementation patterns",
-                "If decipher information is provided:",
-                "  • MUST use the import statement to import the decipher class",
-                "  • MUST execute command using: cli_session.send_command(command=CLI_COMMAND, decipher=DECIPHER_CLASS_NAME)",
-                "  • MUST use the expected output format to validate results",
-                "IMPORTANT: Extract step logic into separate method if possible",
-                "IMPORTANT: Add logger at beginning of test step with step number",
-                "IMPORTANT: Generate complete updated test file content",
-                "IMPORTANT: Define constants instead of hardcoded values (e.g., WAIT_TIME_SECONDS = 60)",
-                "IMPORTANT: Use meaningful constant names in UPPER_CASE format",
-                "IMPORTANT: Place constants at class level or module level as appropriate",
-                "CRITICAL: DO NOT include any markdown formatting or code blocks",
-                "CRITICAL: DO NOT use backticks (```) or language tags like ```python",
-                "CRITICAL: Return only raw Python code without any markdown delimiters"
-                "CRITICAL: DO NOT remove any unused imports, constants, variables, or methods - they will be used in later steps"
-                "To effectively inform users about the validation process, add INFO level logs that are both informative and concise."
-            ],
+            requirements=self._test_step_requirements(),
             context=context,
             output_format="""
 # new_file_content
@@ -614,33 +1049,90 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
 """
         )
 
-    def _process_test_step_response(self, content: str, messages: list[dict]) -> tuple[Optional[str], Optional[str], bool]:
+    def _test_step_requirements(self) -> list[str]:
+        """
+        Requirements of a generated test step implementation.
+
+        Returns:
+            list[str]: Prompt requirements
+        """
+        return [
+            "MUST follow the existing test structure and patterns",
+            "MUST add clear comments explaining the implementation",
+            "MUST use the code snippets as reference for implementation patterns",
+            "If decipher information is provided, MUST use the import statement to import the decipher class",
+            "If decipher information is provided, MUST execute command using: cli_session.send_command(command=CLI_COMMAND, decipher=DECIPHER_CLASS_NAME)",
+            "If decipher information is provided, MUST use the expected output format to validate results",
+            "IMPORTANT: Extract step logic into separate method if possible",
+            "IMPORTANT: Add logger at beginning of test step with step number",
+            "IMPORTANT: Generate complete updated test file content",
+            "IMPORTANT: Define constants instead of hardcoded values (e.g., WAIT_TIME_SECONDS = 60)",
+            "IMPORTANT: Use meaningful constant names in UPPER_CASE format",
+            "IMPORTANT: Place constants at class level or module level as appropriate",
+            "CRITICAL: Return only raw Python code, without markdown formatting, code blocks, backticks (```) or language tags like ```python",
+            "CRITICAL: DO NOT remove any unused imports, constants, variables, or methods - they will be used in later steps",
+            "To effectively inform users about the validation process, add INFO level logs that are both informative and concise."
+        ]
+
+    def _create_test_steps_bulk_prompt(self,
+                                       zcode_snippets: str,
+                                       test_file_content: str,
+                                       steps: list[dict],
+                                       deciphers_map: dict) -> str:
+        """Create a structured prompt implementing all the test steps with a single response."""
+        steps_details = []
+        for number, step in enumerate(steps, 1):
+            decipher_info, _, _ = self._get_decipher_info(step, deciphers_map)
+            steps_details.append(f"Step {number}:\n{yaml_dump(step)}{decipher_info}")
+
+        return self._create_structured_prompt(
+            task="""Implement all the following test steps, in order, by updating the existing test file content. Add the implementation to the test method following the existing structure.
+            Pay attention to the clarifications that might be provided in the steps.
+            If a step contains CLI command, use the decipher class to parse the output. Use the decipher output example from the provided decipher information, to understand the expected output format.
+            """,
+            requirements=self._test_step_requirements() + [
+                "MUST implement every step, in the given order",
+                "MUST explain each step separately, between <step_N> and </step_N> tags where N is the step number"
+            ],
+            context={
+                "code_snippets": zcode_snippets,
+                "current_test_file": test_file_content,
+                "steps": "\n".join(steps_details)
+            },
+            output_format="""
+# new_file_content
+[Complete updated test file content implementing all the steps]
+
+# step_explanations
+<step_1>
+[Explanation of the changes made for step 1]
+</step_1>
+<step_2>
+[Explanation of the changes made for step 2]
+</step_2>
+[... one block per step]
+"""
+        )
+
+    def _process_test_step_response(self, content: str) -> tuple[Optional[str], Optional[str], bool]:
         """
         Process OpenAI response for test step creation.
         
         Returns:
-            tuple[Optional[str], Optional[str], bool]: (new_file_content, explanation, success)
+            tuple[Optional[str], Optional[str], bool]: (new_file_content, explanation, success).
+            Success requires both sections to be non-empty.
         """
         # Split into new file content and explanation
-        parts = content.split("# new_file_content")
-        if len(parts) != 2:
-            messages.append({
-                "role": "user",
-                "content": "Your response is missing the '# new_file_content' marker. Please provide the response in the correct format with new file content and explanation sections."
-            })
+        sections, missing_marker = self._split_response_sections(content, ("# new_file_content", "# explanation"))
+        if missing_marker:
+            print(f"Response is missing the '{missing_marker}' marker")
             return None, None, False
         
-        file_content_part = parts[1].split("# explanation")
-        if len(file_content_part) != 2:
-            messages.append({
-                "role": "user",
-                "content": "Your response is missing the '# explanation' marker. Please provide the response in the correct format with new file content and explanation sections."
-            })
+        new_file_content, explanation = sections
+        if not new_file_content or not explanation:
+            print("Response has an empty new file content or explanation section")
             return None, None, False
         
-        new_file_content = file_content_part[0].strip()
-        explanation = file_content_part[1].strip()
-        
         return new_file_content, explanation, True
 
 
@@ -655,6 +1147,26 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
                         test_folder_path: str) -> tuple[dict, dict]:
         """
         Create a test step implementation by updating the test file.
+        Synchronous wrapper around create_test_step_async, see there for the arguments.
+
+        Returns:
+            tuple[dict, dict]: (Updated step, updated deciphers_map)
+        """
+        return self._run_sync(self.create_test_step_async(
+            zcode_snippets, deciphers_map, step, test_file_path, test_file_content,
+            previous_steps_description, test_folder_path
+        ))
+
+    async def create_test_step_async(self,
+                                     zcode_snippets: str,
+                                     deciphers_map: dict,
+                                     step: dict,
+                                     test_file_path: str,
+                                     test_file_content: str,
+                                     previous_steps_description: list[str],
+                                     test_folder_path: str) -> tuple[dict, dict]:
+        """
+        Create a test step implementation by updating the test file.
         
         Args:
             zcode_snippets: Code snippets for reference patterns
@@ -666,22 +1178,25 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
             test_folder_path: Path to the test folder for decipher creation
             
         Returns:
-            tuple[dict, dict]: (Updated step with test_file_content and explanation, updated deciphers_map)
+            tuple[dict, dict]: (Updated step with test_file_content, explanation and status, updated deciphers_map).
+            The step status is "ok" on success and "error" otherwise, with the failure reason in "detail".
         """
                 # Print step description for clarity
         print("\nProcessing test step:")
         print("=" * 80)
-        print(yaml.dump(step, default_flow_style=False))
+        if self.debug_mode:
+            print(yaml_dump(step))
+        else:
+            # The CLI output example can be long, the description is enough to follow the progress
+            step_key = self._get_step_key(step)
+            print(f"{step_key}: {step[step_key]}")
         print("=" * 80)
 
 
-        # Handle decipher creation if needed
-        if "cli_output_example" in step:
-            step_key = list(step.keys())[0]  # Get the first key (e.g., "step 1")
-            step["description_key"] = step_key
-            decipher_id = f"{step_key.replace(' ', '_')}_decipher"
-            step["decipher_id"] = decipher_id
-            decipher = self.create_decipher(step, test_folder_path)
+        # Handle decipher creation if needed (skipped when generate_test created it beforehand)
+        if "cli_output_example" in step and step.get("decipher_id") not in deciphers_map:
+            self._assign_decipher_id(step)
+            decipher = await self.create_decipher_async(step, test_folder_path)
             deciphers_map[decipher["decipher_id"]] = decipher
 
 
@@ -695,54 +1210,152 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
         )
         
         # Prepare messages for OpenAI
-        messages = [
-            {"role": "system", "content": "You are a Python network automation expert specializing in test automation. You must respond with executable Python code that follows the project's structure and standards."},
-            {"role": "user", "content": prompt}
-        ]
+        messages = self._create_messages(SYSTEM_MESSAGE_TEST_STEP, prompt)
 
-        # Process with retry logic
+        # Process with retry logic. Format feedback is added to the original messages for the next attempt
+        # only, instead of accumulating in the conversation.
+        request_messages = messages
         for attempt in range(MAX_ATTEMPTS):
             print(f"Sending prompt to OpenAI... Attempt {attempt + 1} of {MAX_ATTEMPTS}")
-            self._save_messages(messages)
+            self._save_messages(request_messages)
             
-            response = self.client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=messages,
-                temperature=0.1
+            content = await self._stream_chat_completion_async(
+                request_messages, "# new_file_content", echo_marker="# explanation"
             )
             print("Received response from OpenAI")
             
+            if content is None:
+                request_messages = messages + [{
+                    "role": "user",
+                    "content": "Your response must start with the '# new_file_content' marker. Please provide the response in the correct format with new file content and explanation sections."
+                }]
+                continue
+
             # Check for empty response
-            content = response.choices[0].message.content
             if not content:
-                messages.append({
+                request_messages = messages + [{
                     "role": "user",
                     "content": "OpenAI returned empty response. Please provide the response in the correct format with new file content and explanation sections."
-                })
+                }]
                 continue
             
-            # Process the response
-            new_file_content, explanation, success = self._process_test_step_response(content, messages)
+            # Process the response, a misplaced marker is repaired with a short request holding only the response
+            new_file_content, explanation, success = self._process_test_step_response(content)
+            if not success:
+                new_file_content, explanation, success = await self._repair_test_step_response(content)
             
-            if success and new_file_content and explanation:
-                # Log the explanation
-                print("\nImplementation Explanation:")
-                print("=" * 80)
-                print(explanation)
-                print("=" * 80)
-                
-                # Write the new file content
+            if success:
+                # The explanation was printed while streaming, write the new file content
                 with open(test_file_path, "w") as f:
                     f.write(new_file_content)
                 
                 step["test_file_content"] = new_file_content
                 step["explanation"] = explanation
+                step["status"] = "ok"
                 return step, deciphers_map
 
         # If we reach here, all attempts failed
         print(f"Failed to generate test step after {MAX_ATTEMPTS} attempts")
+        step["status"] = "error"
+        step["detail"] = f"Failed to generate test step after {MAX_ATTEMPTS} attempts"
         return step, deciphers_map
 
+    async def create_test_steps_bulk_async(self,
+                                           zcode_snippets: str,
+                                           deciphers_map: dict,
+                                           steps: list[dict],
+                                           test_file_path: str,
+                                           test_file_content: str) -> Optional[list[dict]]:
+        """
+        Implement all the test steps with a single OpenAI request instead of one request per step,
+        sending the code snippets and test file once. The deciphers of the steps must already be in deciphers_map.
+
+        Args:
+            zcode_snippets: Code snippets for reference patterns
+            deciphers_map: Map of available deciphers
+            steps: Step definitions to implement, in order
+            test_file_path: Path to the test file to update
+            test_file_content: Current content of the test file
+
+        Returns:
+            Optional[list[dict]]: The steps updated like by create_test_step, or None if no attempt returned
+            the test file with an explanation per step, so the caller can fall back to create_test_step
+        """
+        prompt = self._create_test_steps_bulk_prompt(zcode_snippets, test_file_content, steps, deciphers_map)
+        messages = self._create_messages(SYSTEM_MESSAGE_TEST_STEP, prompt)
+
+        # Format feedback is added to the original messages for the next attempt only, instead of accumulating
+        request_messages = messages
+        for attempt in range(MAX_ATTEMPTS):
+            print(f"Sending prompt to OpenAI for all {len(steps)} steps... Attempt {attempt + 1} of {MAX_ATTEMPTS}")
+            self._save_messages(request_messages)
+            content = await self._stream_chat_completion_async(request_messages, "# new_file_content")
+            print("Received response from OpenAI")
+
+            sections, missing_marker = self._split_response_sections(
+                content or "", ("# new_file_content", "# step_explanations")
+            )
+            if missing_marker:
+                request_messages = messages + [{
+                    "role": "user",
+                    "content": f"Your response is missing the '{missing_marker}' marker. Please provide the response in the correct format with new file content and step explanations sections."
+                }]
+                continue
+
+            new_file_content, step_explanations = sections
+            explanations = {
+                int(match.group(1)): match.group(2).strip()
+                for match in STEP_EXPLANATION_PATTERN.finditer(step_explanations)
+            }
+            missing_steps = [number for number in range(1, len(steps) + 1) if not explanations.get(number)]
+            if not new_file_content or missing_steps:
+                request_messages = messages + [{
+                    "role": "user",
+                    "content": f"Your response is missing the explanations of steps {missing_steps}. Please provide the complete test file and one <step_N> explanation block per step."
+                }]
+                continue
+
+            print("\nImplementation Explanation:")
+            print("=" * 80)
+            print(step_explanations)
+            print("=" * 80)
+
+            with open(test_file_path, "w") as f:
+                f.write(new_file_content)
+
+            for number, step in enumerate(steps, 1):
+                step["test_file_content"] = new_file_content
+                step["explanation"] = explanations[number]
+                step["status"] = "ok"
+            return steps
+
+        print(f"Failed to generate all the test steps at once after {MAX_ATTEMPTS} attempts")
+        return None
+
+    def _assign_decipher_id(self, step: dict):
+        """
+        Set the description key and decipher id of a step that requires a decipher.
+
+        Args:
+            step (dict): Step definition containing a CLI output example
+        """
+        step_key = self._get_step_key(step)
+        step["description_key"] = step_key
+        step["decipher_id"] = f"{step_key.replace(' ', '_')}_decipher"
+
+    def _get_step_key(self, step: dict) -> str:
+        """
+        Get the key holding the step description, e.g. "step 1". It is looked up by name, as a step
+        saved with sorted keys starts with its cli_output_example.
+
+        Args:
+            step (dict): Step definition
+
+        Returns:
+            str: The step key, or the first key of a step without one
+        """
+        return next((key for key in step if key.startswith("step")), next(iter(step)))
+
     def analyze_test_prompt(self, prompt_content: dict, test_folder_path: str) -> tuple[bool, dict]:
         """
         Analyze the test prompt quality and gather necessary clarifications from the user.
@@ -759,7 +1372,6 @@ If the "Step Details" hint at the purpose of the parameter, incorporate that int
         QUALITY_THRESHOLD = 5.0  # Minimum score to proceed with test generation
         
         prompt = self._create_structured_prompt(
-            role="Test prompt quality analyst",
             task="""Analyze the test prompt and identify areas needing clarification for automated test generation.
 Analyze if the provided test description is clear enough for automated code generation. The test step can contain CLI command. Cli command should be specified. In case and the step contains cli command, it must contains the example of the cli output for that command.
 In case and the step contains cli command, further step generation logic will create a decipher for it.
@@ -774,10 +1386,11 @@ It should be clear from the test prompt, what information should be extracted by
                 "MUST generate specific clarification questions for unclear aspects",
                 "MUST provide suggested answer options for each question",
                 "MUST check if steps are logically ordered",
-                "MUST check for missing dependencies between steps"
+                "MUST check for missing dependencies between steps",
+                "MUST respond with a single JSON object following the output format"
             ],
             context={
-                "prompt_content": yaml.dump(prompt_content, default_flow_style=False)
+                "prompt_content": yaml_dump(prompt_content)
             },
             output_format="""
             {
@@ -808,26 +1421,21 @@ It should be clear from the test prompt, what information should be extracted by
             """
         )
 
-        messages = [
-            {"role": "system", "content": "You are a test prompt quality analyst. You must evaluate test prompts for clarity and identify areas needing clarification."},
-            {"role": "user", "content": prompt}
-        ]
+        messages = self._create_messages(SYSTEM_MESSAGE_PROMPT_ANALYSIS, prompt)
 
         print("\nAnalyzing test prompt quality...")
         self._save_messages(messages)
-        response = self.client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=messages,
-            temperature=0.1
-        )
+        # JSON mode guarantees a parsable response, without markdown fences or comments around it
+        content = self._run_sync(self._cached_chat_content_async(
+            messages, response_format={"type": "json_object"}, validate=self._is_valid_prompt_analysis
+        ))
 
         try:
-            content = response.choices[0].message.content
             if not content:
                 print("Error: Received empty response from OpenAI")
                 return False, prompt_content
                 
-            analysis = json.loads(content)
+            analysis = json_loads(content)
             quality_score = float(analysis["quality_score"])
             step_questions = analysis["step_questions"]
             general_issues = analysis["general_issues"]
@@ -867,25 +1475,18 @@ It should be clear from the test prompt, what information should be extracted by
                     clarifications = {}
 
                     for i, q in enumerate(questions, 1):
-                        while True:
-                            print(f"\nQuestion {i}: {q['question']}")
-                            print("Suggested answers:")
-                            for j, ans in enumerate(q['suggested_answers'], 1):
-                                print(f"  {j}. {ans}")
-                            user_input = input("\nYour clarification (enter answer number or free text): ").strip()
-
-                            # Try to interpret as answer number
-                            try:
-                                ans_num = int(user_input)
-                                if 1 <= ans_num <= len(q['suggested_answers']):
-                                    clarifications[q['question']] = q['suggested_answers'][ans_num - 1]
-                                    break
-                            except ValueError:
-                                # User provided free text
-                                clarifications[q['question']] = user_input
-                                break
-
-                            print("Invalid input. Please try again.")
+                        print(f"\nQuestion {i}: {q['question']}")
+                        print("Suggested answers:")
+                        for j, ans in enumerate(q['suggested_answers'], 1):
+                            print(f"  {j}. {ans}")
+                        user_input = input("\nYour clarification (enter answer number or free text): ").strip()
+
+                        # An answer number selects a suggested answer, anything else is a free text answer
+                        answer_number = ANSWER_NUMBER_PATTERN.fullmatch(user_input)
+                        if answer_number and 1 <= int(answer_number[1]) <= len(q['suggested_answers']):
+                            clarifications[q['question']] = q['suggested_answers'][int(answer_number[1]) - 1]
+                        else:
+                            clarifications[q['question']] = user_input
 
                     # Find the step in the prompt content and add clarifications
                     for step in enriched_prompt:
@@ -896,7 +1497,7 @@ It should be clear from the test prompt, what information should be extracted by
                 # Save enriched prompt to a file in the test folder
                 enriched_prompt_file = os.path.join(test_folder_path, "enriched_prompt.yml")
                 with open(enriched_prompt_file, "w") as f:
-                    yaml.dump(enriched_prompt, f, default_flow_style=False)
+                    yaml.dump(enriched_prompt, f, Dumper=PromptFileDumper, default_flow_style=False, sort_keys=False)
                 print(f"\nEnriched prompt saved to {enriched_prompt_file}")
 
             return True, enriched_prompt
@@ -905,25 +1506,52 @@ It should be clear from the test prompt, what information should be extracted by
             print(f"Error parsing analysis response: {str(e)}")
             return False, prompt_content
 
+    def _is_valid_prompt_analysis(self, content: str) -> bool:
+        """
+        Check that a prompt analysis response holds the fields read by analyze_test_prompt.
+
+        Args:
+            content (str): Response content
+
+        Returns:
+            bool: Whether the response can be used
+        """
+        try:
+            analysis = json_loads(content)
+            float(analysis["quality_score"])
+            return all(field in analysis for field in ("step_questions", "general_issues"))
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+            return False
+
     def run_pylint(self, file_path: str) -> Tuple[int, str]:
         """
-        Run pylint on a file and capture its output.
-        
+        Run pylint on a file or a directory and capture its output.
+
         Args:
-            file_path (str): Path to the file to check
-            
+            file_path (str): Path to the file or directory to check
+
         Returns:
             Tuple[int, str]: (exit_code, output)
         """
-        # Run pylint in a subprocess
-        result = subprocess.run(
-            ["pylint", str(file_path)],
-            capture_output=True,
-            text=True,
-            env=os.environ.copy()
+        # A single file gains nothing from a worker pool, a directory is linted in parallel
+        jobs = (os.cpu_count() or 1) if os.path.isdir(file_path) else 1
+
+        # pylint takes a while to import and is only needed once the test is generated
+        from astroid import MANAGER as ASTROID_MANAGER
+        from pylint.lint import Run as PylintRun
+        from pylint.reporters.text import TextReporter
+
+        # Run pylint in-process, sparing an interpreter start and the pylint imports on every fix iteration.
+        # astroid caches parsed modules by name, drop them so an edited file is read again
+        ASTROID_MANAGER.clear_cache()
+        output = io.StringIO()
+        result = PylintRun(
+            [f"--jobs={jobs}", "--persistent=yes", str(file_path)],
+            reporter=TextReporter(output),
+            exit=False
         )
-        
-        return result.returncode, result.stdout + result.stderr
+
+        return result.linter.msg_status, output.getvalue()
 
     def fix_pylint_issues(self, file_path: str, pylint_output: str, current_content: str) -> str:
         """
@@ -938,7 +1566,6 @@ It should be clear from the test prompt, what information should be extracted by
             str: Fixed file content
         """
         prompt = self._create_structured_prompt(
-            role="Python code quality expert",
             task="Fix pylint issues in the provided Python code while maintaining its functionality.",
             requirements=[
                 "MUST fix all pylint issues reported",
@@ -963,39 +1590,26 @@ It should be clear from the test prompt, what information should be extracted by
             """
         )
 
-        messages = [
-            {"role": "system", "content": "You are a Python code quality expert. You must fix pylint issues while maintaining code functionality."},
-            {"role": "user", "content": prompt}
-        ]
+        messages = self._create_messages(SYSTEM_MESSAGE_PYLINT_FIX, prompt)
 
         print("\nRequesting OpenAI to fix pylint issues...")
         self._save_messages(messages)
-        response = self.client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=messages,
-            temperature=0.1
+        # The explanation is printed while streaming
+        content = self._run_sync(
+            self._cached_chat_content_async(
+                messages, "# fixed_code", echo_marker="# explanation",
+                validate=lambda response: self._split_response_sections(response, PYLINT_FIX_MARKERS)[1] is None
+            )
         )
-
-        content = response.choices[0].message.content
         if not content:
             return current_content
 
         # Extract fixed code
-        parts = content.split("# fixed_code")
-        if len(parts) != 2:
-            return current_content
-
-        code_part = parts[1].split("# explanation")
-        if len(code_part) != 2:
+        sections, missing_marker = self._split_response_sections(content, PYLINT_FIX_MARKERS)
+        if missing_marker:
             return current_content
 
-        fixed_code = code_part[0].strip()
-        explanation = code_part[1].strip()
-
-        print("\nCode Fix Explanation:")
-        print("=" * 80)
-        print(explanation)
-        print("=" * 80)
+        fixed_code, _ = sections
 
         return fixed_code
 
@@ -1025,7 +1639,6 @@ It should be clear from the test prompt, what information should be extracted by
       10.28.88.137    4      33287      20244       9355    0     0       0 3d05h55m               4013"""
 
         prompt = self._create_structured_prompt(
-            role="You are an AI Agent that know to perform text-to-yaml conversion",
             task="Apply a set of rules to a given free text file to structure it into yaml. the yaml will represent a structured description of some networking test",
             requirements=[
                 """Step Identification Patterns: Look for lines starting with "- step" followed by a number and colon. Examples include "- step 1:", "- step: 3", "- step1:". Accept variations in formatting but step numbers should be sequential, though handle gaps gracefully.""",
@@ -1052,61 +1665,161 @@ It should be clear from the test prompt, what information should be extracted by
             """
         )
 
-        messages = [
-            {"role": "system", "content": "You need to transform the etxt file into yaml structure following the specifued rules"},
-            {"role": "user", "content": prompt}
-        ]
+        messages = self._create_messages(SYSTEM_MESSAGE_PROMPT_FORMAT, prompt)
 
         print("\nAsking OpenAI to fix the YAML format...")
         self._save_messages(messages)
+        # Feedback is added to the original messages for the next attempt only, instead of accumulating
+        request_messages = messages
         content = ""
         for attempt in range(MAX_ATTEMPTS):
             print(f"Sending prompt to OpenAI... Attempt {attempt + 1} of {MAX_ATTEMPTS}")
-            response = self.client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=messages,
-                temperature=0.1
-            )
-            content = response.choices[0].message.content.strip()
+            content = (self._run_sync(
+                self._stream_chat_completion_async(request_messages, None, **DETERMINISTIC_SAMPLING)
+            ) or "").strip()
             print("Received response from OpenAI:\n<response>\n%s\n</response>" % content)
             if not content:
                 print("Error: Received empty response from OpenAI")
-                messages.append({
+                request_messages = messages + [{
                     "role": "user",
                     "content": "OpenAI returned empty response. Please provide the response in the correct format with new file content and explanation sections."
-                })
+                }]
                 continue
             try:
-                steps = yaml.safe_load(content)
+                steps = yaml.load(content, Loader=YamlLoader)
                 if not isinstance(steps, list):
                     print("Error: OpenAI response is not a valid YAML list")
-                    messages.append({
+                    request_messages = messages + [{
                         "role": "user",
                         "content": f"Your response is not a valid YAML list. It has type {type(steps)}. Please fix it and return a valid YAML list."
-                    })
+                    }]
                     continue
                 if len(steps) == 0:
                     print("Error: OpenAI response is an empty YAML list")
-                    messages.append({
+                    request_messages = messages + [{
                         "role": "user",
                         "content": "Your response is an empty YAML list. Please fix it and return a valid YAML list with at least one step."
-                    })
+                    }]
                     continue
                 return steps
             except yaml.YAMLError as e:
                 print(f"Error parsing YAML content: {str(e)}")
-                messages.append({
-                    "role": "user",
-                    "content": f"Your response is not valid YAML. Please fix it and return valid YAML content.\n\n{content}. got yaml.YAMLError {str(e)} while trying to perform yaml.safe_load(content) on it. Please fix the YAML format and try again."
-                })
+                # A syntax error is repaired from the response and the error alone, without the conversion rules
+                request_messages = self._create_messages(
+                    SYSTEM_MESSAGE_PROMPT_FORMAT,
+                    f"Fix the YAML syntax error in the following content without changing anything else. "
+                    f"Return only the fixed YAML.\n\nyaml.YAMLError: {str(e)}\n\n{content}"
+                )
                 continue
         raise RuntimeError("OpenAI failed to convert the prompt to YAML format after all attempts. Please check the prompt and try again.")
 
 
-    def generate_test(self, test_name: str):
-        # Ask user about debug mode
-        debug_mode = input("Run test generation in debug mode? (y/n): ").lower().strip() == 'y'
-        self.debug_mode = debug_mode
+    async def _generate_test_steps_async(self,
+                                         zcode_snippets: str,
+                                         steps: list[dict],
+                                         test_file_path: str,
+                                         test_file_content: str,
+                                         test_folder_path: str,
+                                         bulk: bool = False) -> tuple[dict, bool]:
+        """
+        Implement the test steps one after the other, while their deciphers are generated concurrently.
+        Each step updates the test file written by the previous one, so only the deciphers run ahead:
+        a step waits for its own decipher only, and the deciphers still in progress are cancelled when a step fails. In debug mode the deciphers are generated one after the other.
+        In bulk mode all the steps are first implemented with a single request, once all deciphers are ready.
+
+        Args:
+            zcode_snippets (str): Code snippets for reference patterns
+            steps (list[dict]): Step definitions, enriched with the clarifications
+            test_file_path (str): Path to the test file to update
+            test_file_content (str): Initial content of the test file
+            test_folder_path (str): Path to the test folder
+            bulk (bool): Try implementing all the steps with a single request, falling back to one request per step
+
+        Returns:
+            tuple[dict, bool]: (deciphers_map, generation_failed)
+        """
+        # Deciphers don't depend on each other, start all of them concurrently up front
+        decipher_tasks = {}
+        for step in steps:
+            if "cli_output_example" in step:
+                self._assign_decipher_id(step)
+                decipher_tasks[step["decipher_id"]] = asyncio.create_task(
+                    self.create_decipher_async(step, test_folder_path)
+                )
+                # Debug mode pauses for review on every saved prompt, which blocks the event loop,
+                # so the deciphers are generated one after the other before the steps
+                if self.debug_mode:
+                    await asyncio.wait([decipher_tasks[step["decipher_id"]]])
+        deciphers_map = {}
+
+        # Slot per step, filled by index so results can be placed regardless of completion order
+        steps_description = [None] * len(steps)
+        generation_failed = False
+
+        # create_test_step writes the file and returns its new content, no need to re-read it per step
+        current_test_file_content = test_file_content
+
+        try:
+            if bulk:
+                # The single request needs the information of every decipher
+                for decipher_id, task in decipher_tasks.items():
+                    deciphers_map[decipher_id] = await task
+                if await self.create_test_steps_bulk_async(
+                    zcode_snippets, deciphers_map, steps, test_file_path, test_file_content
+                ):
+                    return deciphers_map, False
+                print("Falling back to implementing the test steps one by one")
+
+            for i, step in enumerate(steps):
+                print(f"\nProcessing step: {step}")
+
+                if step.get("decipher_id") in decipher_tasks:
+                    deciphers_map[step["decipher_id"]] = await decipher_tasks[step["decipher_id"]]
+
+                res, deciphers_map = await self.create_test_step_async(zcode_snippets,
+                    deciphers_map,
+                    step,
+                    test_file_path,
+                    current_test_file_content,
+                    steps_description[:i],
+                    test_folder_path)
+
+                # Stop early - the following steps would build on a broken test file
+                if res.get("status") == "error":
+                    print(f"\nTest generation halted: {res.get('detail')}")
+                    generation_failed = True
+                    break
+
+                steps_description[i] = res["explanation"]
+                current_test_file_content = res["test_file_content"]
+        finally:
+            # After a halt or an error, stop the deciphers still in progress instead of waiting for all their attempts
+            for task in decipher_tasks.values():
+                task.cancel()
+            await asyncio.gather(*decipher_tasks.values(), return_exceptions=True)
+
+        # Deciphers completed ahead of their steps are kept, the cancelled and failed ones are left out
+        for decipher_id, task in decipher_tasks.items():
+            if decipher_id not in deciphers_map and not task.cancelled() and task.exception() is None:
+                deciphers_map[decipher_id] = task.result()
+
+        return deciphers_map, generation_failed
+
+    def generate_test(self, test_name: str, bulk_steps: bool = False):
+        """
+        Generate a test, its deciphers and their unit tests from the test prompt.
+
+        Args:
+            test_name (str): Name of the test, its folder is tests/lab1/<test_name>
+            bulk_steps (bool): Implement all the test steps with a single OpenAI request, which sends the
+                code snippets and test file once instead of once per step. Falls back to one request per step.
+        """
+        # The client may generate several tests, reset the state of the previous one.
+        # The response and decipher caches are keyed by content and stay valid across tests.
+        self._folder_locks.clear()
+
+        # Ask user about debug mode, for every test
+        self.debug_mode = input("Run test generation in debug mode? (y/n): ").lower().strip() == 'y'
         
         test_folder_path = os.path.join("tests", "lab1", test_name)
 
@@ -1118,7 +1831,7 @@ It should be clear from the test prompt, what information should be extracted by
         guide_file_txt = os.path.join(test_folder_path, "prompt.txt")
         try:
             with open(guide_file_yml, "r") as f:
-                steps = yaml.safe_load(f)
+                steps = yaml.load(f, Loader=YamlLoader)
         except (FileNotFoundError, yaml.YAMLError) as e:
             # If YAML file doesn't exist or has invalid format, try to read and convert text file
             try:
@@ -1128,7 +1841,7 @@ It should be clear from the test prompt, what information should be extracted by
                 steps = self.fix_prompt_file_format(txt_content)
                 # Save the converted content as YAML
                 with open(guide_file_yml, "w") as f:
-                    yaml.safe_dump(steps, f)
+                    yaml.dump(steps, f, Dumper=PromptFileDumper, sort_keys=False)
             except (FileNotFoundError, IOError) as e:
                 raise RuntimeError(f"Neither prompt.yml nor prompt.txt found in {test_folder_path}") from e
             
@@ -1140,51 +1853,57 @@ It should be clear from the test prompt, what information should be extracted by
         # Create test file from template
         test_file_path, test_file_content = self.create_test_file(test_name, test_folder_path)
         
-        deciphers_map = {}
-        steps_description = []
+        deciphers_map, generation_failed = self._run_sync(self._generate_test_steps_async(
+            zcode_snippets, enriched_steps, test_file_path, test_file_content, test_folder_path, bulk_steps
+        ))
 
-        for step in enriched_steps:
-            print(f"\nProcessing step: {step}")
-        
-            # Refresh test_file_content with current file content before each step
-            with open(test_file_path, "r") as f:
-                current_test_file_content = f.read()
-            
-            res, deciphers_map = self.create_test_step(zcode_snippets, 
-                deciphers_map, 
-                step, 
-                test_file_path, 
-                current_test_file_content,
-                steps_description,
-                test_folder_path)
+        # Persist the deciphers map once, after all steps were processed
+        deciphers_map_file = os.path.join(test_folder_path, "deciphers_map.pkl")
+        with open(deciphers_map_file, "wb") as f:
+            pickle.dump(deciphers_map, f)
+        print(f"Deciphers map saved to {deciphers_map_file}")
 
-            steps_description.append(res["explanation"])
+        if generation_failed:
+            return
 
         # Run pylint validation and fix issues
         print("\nValidating test file with pylint...")
+        # The fixes are written by this loop, the file is read once and its content kept up to date
+        with open(test_file_path, "r") as f:
+            current_content = f.read()
         attempt = 0
+        issues_count = None
+        stalled_attempts = 0
         while attempt < MAX_ATTEMPTS:
             exit_code, pylint_output = self.run_pylint(test_file_path)
             
             if exit_code == 0:
                 print("Pylint validation passed!")
                 break
+
+            # Give up early when the fixes stop reducing the number of issues
+            previous_issues_count = issues_count
+            issues_count = len(PYLINT_ISSUE_PATTERN.findall(pylint_output))
+            if previous_issues_count is not None and issues_count >= previous_issues_count:
+                stalled_attempts += 1
+            else:
+                stalled_attempts = 0
+            if stalled_attempts >= MAX_STALLED_PYLINT_ATTEMPTS:
+                print(f"\nWarning: Pylint fixes stalled at {issues_count} issues, giving up after {attempt} attempts.")
+                break
                 
-            print(f"\nPylint found issues (attempt {attempt + 1} of {MAX_ATTEMPTS}):")
+            print(f"\nPylint found {issues_count} issues (attempt {attempt + 1} of {MAX_ATTEMPTS}):")
             print(pylint_output)
             
-            # Read current content
-            with open(test_file_path, "r") as f:
-                current_content = f.read()
-            
             # Try to fix issues
             fixed_content = self.fix_pylint_issues(test_file_path, pylint_output, current_content)
             
             # Write fixed content
             with open(test_file_path, "w") as f:
                 f.write(fixed_content)
+            current_content = fixed_content
             
             attempt += 1
             
         if attempt == MAX_ATTEMPTS:
-            print("\nWarning: Could not fix all pylint issues after maximum attempts.")
+            print(f"\nWarning: Could not fix all pylint issues after maximum attempts (last pylint run reported {issues_count} issues).")
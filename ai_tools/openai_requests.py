@@ -0,0 +1,373 @@
+"""
+OpenAI chat requests of the test generator and the caches of their results: streaming with early
+format checks, backoff on transient errors, the cache of deterministic responses and the decipher cache.
+"""
+
+import os
+import hashlib
+import json
+import tempfile
+import time
+from typing import Callable, Optional
+from openai import RateLimitError, APIConnectionError, APITimeoutError, NOT_GIVEN
+from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception_type
+
+try:
+    import orjson
+    json_loads = orjson.loads
+
+    def json_dumps_sorted(data) -> bytes:
+        """Serialize data to JSON with sorted keys, for hashing it into a cache key."""
+        return orjson.dumps(data, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    # orjson is optional, it only speeds up parsing large JSON examples and computing cache keys
+    json_loads = json.loads
+
+    def json_dumps_sorted(data) -> bytes:
+        """Serialize data to JSON with sorted keys, for hashing it into a cache key."""
+        return json.dumps(data, sort_keys=True, default=str).encode()
+
+
+OPENAI_MODEL = "gpt-4.1"
+# "gpt-4.1"
+
+# Retry transient OpenAI errors with exponential backoff, so they don't consume the content fix attempts
+retry_transient_errors = retry(
+    wait=wait_random_exponential(min=1, max=60),
+    stop=stop_after_attempt(6),
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, APITimeoutError)),
+    reraise=True
+)
+
+# Folder of the cached OpenAI responses, keyed by a hash of the model and messages
+RESPONSE_CACHE_DIR = os.path.join(".cache", "responses")
+# Cached responses older than this are requested again, so prompt changes on OpenAI's side eventually apply
+RESPONSE_CACHE_MAX_AGE_SECONDS = 7 * 24 * 60 * 60
+# Number of cached responses also kept in memory during a run
+RESPONSE_MEMORY_CACHE_SIZE = 128
+
+# Sampling of requests whose output should be reproducible, e.g. cached or repaired until valid
+DETERMINISTIC_SAMPLING = {"temperature": 0, "seed": 42}
+
+# Timeout of streamed requests, a stalled stream is retried as a timeout instead of hanging.
+# Non-streamed requests keep the SDK default, as they send nothing until the whole response is ready.
+STREAM_TIMEOUT_SECONDS = 60
+
+# Number of streamed characters after which a response must contain its first format marker
+MARKER_PROBE_CHARS = 200
+
+# Folder holding successfully generated deciphers, keyed by a hash of the step content
+DECIPHER_CACHE_DIR = os.path.join(".cache", "deciphers")
+
+# Step fields describing a generated decipher, the only ones stored in the cache
+DECIPHER_CACHE_FIELDS = ("cli_command", "class_name", "import_path", "json_example")
+
+# Version of the decipher prompts, part of the decipher cache key.
+# Bump it when the prompts or requirements change, so deciphers generated by the previous ones are regenerated.
+DECIPHER_PROMPT_VERSION = 2
+
+
+def write_json_atomic(path: str, data: dict):
+    """
+    Write a JSON cache file through a temporary file renamed over it, so concurrent runs sharing
+    the cache never read a partially written file.
+
+    Args:
+        path (str): Path of the cache file
+        data (dict): Content to write
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, default=str)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+
+
+class OpenAIRequestsMixin:
+    """
+    Chat completion requests and result caches of OpenAIClient. The client provides the async_client,
+    the _llm_semaphore bounding the requests in flight, the _recent_responses memory cache, the debug_mode
+    flag and sanitize_folder_name.
+    """
+
+    @retry_transient_errors
+    async def _chat_completion_async(self, messages: list[dict], temperature: float = 0.1, n: int = 1):
+        """
+        Send a chat completion request through the async OpenAI client.
+        Rate limit, connection and timeout errors are retried with exponential backoff,
+        so they don't consume the content fix attempts of the callers.
+
+        Args:
+            messages (list[dict]): Chat messages to send
+            temperature (float): Sampling temperature
+            n (int): Number of completions to sample for the same prompt
+
+        Returns:
+            The OpenAI chat completion response
+        """
+        async with self._llm_semaphore:
+            response = await self.async_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                temperature=temperature,
+                n=n
+            )
+        self._log_prompt_cache_usage(response.usage)
+        return response
+
+    def _log_prompt_cache_usage(self, usage):
+        """
+        Print how many prompt tokens OpenAI served from its automatic prompt cache.
+
+        Args:
+            usage: Token usage of a chat completion, may be None
+        """
+        details = getattr(usage, "prompt_tokens_details", None)
+        if details is not None and details.cached_tokens is not None:
+            print(f"Prompt tokens: {usage.prompt_tokens} ({details.cached_tokens} cached)")
+
+    @retry_transient_errors
+    async def _stream_chat_completion_async(self, messages: list[dict], expected_marker: Optional[str],
+                                            temperature: float = 0.1,
+                                            echo_marker: Optional[str] = None,
+                                            response_format: Optional[dict] = None,
+                                            seed: Optional[int] = None) -> Optional[str]:
+        """
+        Stream a chat completion, aborting it early when the response doesn't follow the expected format.
+
+        Args:
+            messages (list[dict]): Chat messages to send
+            expected_marker (Optional[str]): Marker that must appear within the first MARKER_PROBE_CHARS characters,
+                None for free form responses
+            temperature (float): Sampling temperature
+            echo_marker (Optional[str]): Marker of the last response section, printed while it arrives
+            response_format (Optional[dict]): OpenAI response format, e.g. {"type": "json_object"}
+            seed (Optional[int]): Sampling seed, for best-effort reproducible responses
+
+        Returns:
+            Optional[str]: The complete response content, or None if the stream was aborted
+        """
+        chunks = []
+        received = 0
+        marker_checked = expected_marker is None
+        echoing = False
+        # End of the text received so far, to find an echo marker split across chunks
+        tail = ""
+        async with self._llm_semaphore:
+            stream = await self.async_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=STREAM_TIMEOUT_SECONDS,
+                response_format=response_format or NOT_GIVEN,
+                seed=NOT_GIVEN if seed is None else seed
+            )
+            try:
+                async for chunk in stream:
+                    # The usage comes with the last chunk, which has no choices
+                    if getattr(chunk, "usage", None):
+                        self._log_prompt_cache_usage(chunk.usage)
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    chunks.append(delta)
+                    received += len(delta)
+
+                    # Print the last section, e.g. the explanation, as it arrives
+                    if echoing:
+                        print(delta, end="", flush=True)
+                    elif echo_marker:
+                        window = tail + delta
+                        position = window.find(echo_marker)
+                        if position >= 0:
+                            echoing = True
+                            print(f"\n{echo_marker}\n" + "=" * 80)
+                            print(window[position + len(echo_marker):].lstrip("\n"), end="", flush=True)
+                        else:
+                            tail = window[-len(echo_marker):]
+
+                    # Don't pay for the rest of a response that already missed its format marker
+                    if not marker_checked and received >= MARKER_PROBE_CHARS:
+                        marker_checked = True
+                        if expected_marker not in "".join(chunks):
+                            print(f"Response is missing the '{expected_marker}' marker, aborting the stream")
+                            return None
+            finally:
+                await stream.close()
+                if echoing:
+                    print("\n" + "=" * 80)
+
+        return "".join(chunks)
+
+    async def _cached_chat_content_async(self, messages: list[dict], expected_marker: Optional[str] = None,
+                                         echo_marker: Optional[str] = None,
+                                         response_format: Optional[dict] = None,
+                                         validate: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        """
+        Stream a chat completion, reusing the response to identical messages from earlier runs.
+        Meant for requests repeated with the same inputs while iterating on a test, such as prompt
+        analysis and pylint fixes, so they are sampled deterministically. The cache isn't read in debug mode,
+        and responses older than RESPONSE_CACHE_MAX_AGE_SECONDS are requested again.
+
+        Args:
+            messages (list[dict]): Chat messages to send
+            expected_marker (Optional[str]): Marker that must appear at the start of the response
+            echo_marker (Optional[str]): Marker of the last response section, printed while it arrives
+            response_format (Optional[dict]): OpenAI response format, e.g. {"type": "json_object"}
+            validate (Optional[Callable[[str], bool]]): Check of a new response, which is cached only if it passes
+
+        Returns:
+            Optional[str]: The response content, or None if the stream was aborted
+        """
+        key_content = json_dumps_sorted(
+            {"model": OPENAI_MODEL, "messages": messages, "response_format": response_format,
+             **DETERMINISTIC_SAMPLING}
+        )
+        cache_key = hashlib.blake2b(key_content).hexdigest()
+        cache_file = os.path.join(RESPONSE_CACHE_DIR, f"{cache_key}.json")
+
+        # Responses of this run are served from memory, before reading the cache file
+        if not self.debug_mode and cache_key in self._recent_responses:
+            self._recent_responses.move_to_end(cache_key)
+            print("Using OpenAI response cached in memory")
+            return self._recent_responses[cache_key]
+
+        if (not self.debug_mode and os.path.exists(cache_file)
+                and time.time() - os.path.getmtime(cache_file) <= RESPONSE_CACHE_MAX_AGE_SECONDS):
+            try:
+                with open(cache_file, "rb") as f:
+                    content = json_loads(f.read())["content"]
+                print(f"Using cached OpenAI response from {cache_file}")
+                self._remember_response(cache_key, content)
+                return content
+            except (OSError, KeyError, json.JSONDecodeError) as e:
+                print(f"Failed to load cached response from {cache_file}: {e}")
+
+        return await self._request_and_cache_response_async(
+            messages, expected_marker, echo_marker, response_format, validate, cache_key, cache_file
+        )
+
+    async def _request_and_cache_response_async(self, messages: list[dict], expected_marker: Optional[str],
+                                                echo_marker: Optional[str], response_format: Optional[dict],
+                                                validate: Optional[Callable[[str], bool]],
+                                                cache_key: str, cache_file: str) -> Optional[str]:
+        """
+        Stream a deterministic chat completion and save its content to the response cache.
+        A response failing validation is returned but not cached, so the next run requests it again.
+
+        Args:
+            messages (list[dict]): Chat messages to send
+            expected_marker (Optional[str]): Marker that must appear at the start of the response
+            echo_marker (Optional[str]): Marker of the last response section, printed while it arrives
+            response_format (Optional[dict]): OpenAI response format, e.g. {"type": "json_object"}
+            validate (Optional[Callable[[str], bool]]): Check the response must pass to be cached
+            cache_key (str): Key of the response in the memory cache
+            cache_file (str): Path where the response content is cached
+
+        Returns:
+            Optional[str]: The response content, or None if the stream was aborted
+        """
+        content = await self._stream_chat_completion_async(
+            messages, expected_marker, echo_marker=echo_marker, response_format=response_format,
+            **DETERMINISTIC_SAMPLING
+        )
+        if content and (validate is None or validate(content)):
+            self._remember_response(cache_key, content)
+            try:
+                write_json_atomic(cache_file, {"content": content})
+            except OSError as e:
+                print(f"Warning: Failed to cache response to {cache_file}: {e}")
+        return content
+
+    def _remember_response(self, cache_key: str, content: str):
+        """
+        Keep a response in the memory cache, evicting the least recently used one when full.
+
+        Args:
+            cache_key (str): Key of the response
+            content (str): Response content
+        """
+        self._recent_responses[cache_key] = content
+        self._recent_responses.move_to_end(cache_key)
+        if len(self._recent_responses) > RESPONSE_MEMORY_CACHE_SIZE:
+            self._recent_responses.popitem(last=False)
+
+    def _get_decipher_cache_file(self, step: dict) -> str:
+        """
+        Get the cache file path of a decipher, keyed by a hash of the step content, the model and the prompt version.
+        Only the decipher inputs are hashed, so renumbered steps still hit the cache.
+
+        Args:
+            step (dict): Step definition the decipher is generated for
+
+        Returns:
+            str: Path to the JSON cache file
+        """
+        key_content = json_dumps_sorted({
+            "model": OPENAI_MODEL,
+            "prompt_version": DECIPHER_PROMPT_VERSION,
+            "step_details": step[step["description_key"]],
+            "cli_output_example": step.get("cli_output_example", ""),
+            "clarifications": step.get("clarifications", {})
+        })
+        cache_key = hashlib.sha256(key_content).hexdigest()
+        return os.path.join(DECIPHER_CACHE_DIR, f"{cache_key}.json")
+
+    def _load_cached_decipher(self, cache_file: str, step: dict, test_folder_path: str) -> bool:
+        """
+        Update the step from a cached decipher and write its validated files to the test folder,
+        replacing any other version of them left there, e.g. by a failed generation.
+
+        Args:
+            cache_file (str): Path to the JSON cache file
+            step (dict): Step definition to update
+            test_folder_path (str): Path to the test folder
+
+        Returns:
+            bool: Whether the cached decipher was loaded
+        """
+        if not os.path.exists(cache_file):
+            return False
+
+        print(f"Loading cached decipher from {cache_file}")
+        try:
+            with open(cache_file, "rb") as f:
+                cached = json_loads(f.read())
+
+            command_folder = os.path.join(test_folder_path, self.sanitize_folder_name(cached["decipher"]["cli_command"]))
+            os.makedirs(command_folder, exist_ok=True)
+            for file_name, file_content in cached["files"].items():
+                with open(os.path.join(command_folder, file_name), "w") as f:
+                    f.write(file_content)
+        except (OSError, KeyError, json.JSONDecodeError) as e:
+            print(f"Failed to load cached decipher from {cache_file}: {e}")
+            print("Proceeding with fresh decipher generation...")
+            return False
+
+        step.update(cached["decipher"])
+        print(f"Successfully loaded cached decipher: {step['class_name']}")
+        return True
+
+    def _save_cached_decipher(self, cache_file: str, step: dict, files: dict):
+        """
+        Cache a validated decipher along with its files.
+
+        Args:
+            cache_file (str): Path to the JSON cache file
+            step (dict): Step updated with the decipher information
+            files (dict): Content of the decipher files, keyed by file name
+        """
+        cached = {
+            "decipher": {field: step[field] for field in DECIPHER_CACHE_FIELDS if field in step},
+            "files": files
+        }
+        try:
+            write_json_atomic(cache_file, cached)
+            print(f"Successfully cached decipher to {cache_file}")
+        except OSError as e:
+            print(f"Warning: Failed to cache decipher to {cache_file}: {e}")
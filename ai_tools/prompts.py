@@ -0,0 +1,128 @@
+"""
+Rendering of the test generator prompts: structured prompt sections, system messages and the YAML
+serialization of the prompt files and of the data embedded in the prompts.
+"""
+
+import functools
+import inspect
+import io
+from typing import Optional
+import yaml
+try:
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    # PyYAML built without libyaml
+    from yaml import SafeDumper as YamlDumper
+
+
+class PromptFileDumper(YamlDumper):
+    """
+    YAML dumper of the prompt files, writing multi-line strings such as CLI output examples as literal
+    blocks, the way they are written by hand in prompt.yml, instead of escaped quoted strings.
+    """
+
+
+def _represent_prompt_str(dumper: yaml.Dumper, data: str):
+    style = '|' if '\n' in data else None
+    return dumper.represent_scalar('tag:yaml.org,2002:str', data, style=style)
+
+
+PromptFileDumper.add_representer(str, _represent_prompt_str)
+
+
+def yaml_dump(data) -> str:
+    """
+    Serialize data embedded in the prompts to block style YAML, with the libyaml emitter when available.
+    Keys keep their insertion order, so a step starts with its description as in the prompt file.
+
+    Args:
+        data: Plain data to serialize
+
+    Returns:
+        str: The YAML text
+    """
+    return yaml.dump(data, Dumper=YamlDumper, default_flow_style=False, sort_keys=False)
+
+
+# System messages of the OpenAI requests, shared by all the requests and never mutated
+SYSTEM_MESSAGE_COMBINED_DECIPHER = {"role": "system", "content": "You are a Python network automation expert specializing in CLI command parsing and testing. You must respond with the CLI command, executable Python code and explanations in the specified format."}
+SYSTEM_MESSAGE_DECIPHER_GENERATION = {"role": "system", "content": "You are a Python network automation expert specializing in CLI command parsing and testing. You must respond with executable Python code and explanations in the specified format."}
+SYSTEM_MESSAGE_TEST_STEP = {"role": "system", "content": "You are a Python network automation expert specializing in test automation. You must respond with executable Python code that follows the project's structure and standards."}
+SYSTEM_MESSAGE_PROMPT_ANALYSIS = {"role": "system", "content": "You are a test prompt quality analyst. You must evaluate test prompts for clarity and identify areas needing clarification."}
+SYSTEM_MESSAGE_PYLINT_FIX = {"role": "system", "content": "You are a Python code quality expert. You must fix pylint issues while maintaining code functionality."}
+SYSTEM_MESSAGE_PROMPT_FORMAT = {"role": "system", "content": "You are an AI Agent that knows how to perform text-to-yaml conversion. You need to transform the etxt file into yaml structure following the specifued rules"}
+
+# Keywords marking a prompt requirement as critical
+CRITICAL_KEYWORDS = ('must', 'critical', 'important', 'exactly')
+
+
+@functools.lru_cache(maxsize=256)
+def _render_requirements_section(requirements: tuple[str, ...]) -> str:
+    """
+    Render the requirements section of a structured prompt, shared by all the prompts using the same requirements.
+
+    Args:
+        requirements (tuple[str, ...]): Specific requirements
+
+    Returns:
+        str: The rendered section lines
+    """
+    lines = ["## REQUIREMENTS"]
+    for req in requirements:
+        # Mark critical requirements with a short marker, decorations cost tokens on every line
+        req_lower = req.lower()
+        if any(keyword in req_lower for keyword in CRITICAL_KEYWORDS):
+            lines.append(f"- [!] {req}")
+        else:
+            lines.append(f"- {req}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+@functools.lru_cache(maxsize=64)
+def dedent_prompt_text(text: str) -> str:
+    """
+    Remove the source code indentation of a prompt text literal, once per distinct text.
+
+    Args:
+        text (str): Triple-quoted text, indented like the code defining it
+
+    Returns:
+        str: The text with its common indentation and surrounding blank lines removed
+    """
+    return inspect.cleandoc(text)
+
+
+@functools.lru_cache(maxsize=64)
+def render_prompt_prefix(requirements: tuple[str, ...],
+                          examples: Optional[str],
+                          output_format: Optional[str]) -> str:
+    """
+    Render the static sections of a structured prompt, which repeat across its calls.
+
+    Args:
+        requirements (tuple[str, ...]): Specific requirements
+        examples (Optional[str]): Example content
+        output_format (Optional[str]): Expected output format
+
+    Returns:
+        str: The requirements, examples and output format sections
+    """
+    prefix = io.StringIO()
+
+    # Requirements
+    if requirements:
+        prefix.write(_render_requirements_section(requirements))
+        prefix.write("\n")
+
+    # Examples (if provided)
+    if examples:
+        prefix.write(f"## EXAMPLES\n{examples}\n\n")
+
+    # Output format (if provided)
+    if output_format:
+        prefix.write("## OUTPUT FORMAT\n")
+        prefix.write("Your response must be in this exact format:\n")
+        prefix.write(f"{dedent_prompt_text(output_format)}\n\n")
+
+    return prefix.getvalue()
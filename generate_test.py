@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import os
+import argparse
 import logging
 from ai_tools.openai_client import OpenAIClient
 
@@ -15,11 +16,23 @@ logger = logging.getLogger(__name__)
 TEST_NAME = "test_evpn_vpws_instance_validation"
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate tests from their prompts in tests/lab1/<test_name>")
+    parser.add_argument("test_names", nargs="*", default=[TEST_NAME],
+                        help=f"Names of the tests to generate (default: {TEST_NAME})")
+    parser.add_argument("--bulk-steps", action="store_true",
+                        help="Implement all the steps of a test with a single OpenAI request")
+    args = parser.parse_args()
+
     try:
+        # A single client for all the tests, reusing its OpenAI connections and caches
         client = OpenAIClient()
-        client.generate_test(TEST_NAME)
+        try:
+            for test_name in args.test_names:
+                logger.info(f"Generating test {test_name}")
+                client.generate_test(test_name, bulk_steps=args.bulk_steps)
+        finally:
+            client.close()
 
-        
     except Exception as e:
         logger.error(f"Error generating test: {str(e)}")
         raise
@@ -0,0 +1,112 @@
+"""
+Unit tests of the helpers parsing OpenAI responses and generated unit tests.
+"""
+
+import pytest
+
+from ai_tools.openai_client import OpenAIClient, _find_closing_brace, PYLINT_FIX_MARKERS
+
+
+@pytest.fixture(name="client")
+def client_fixture():
+    """OpenAI client with a dummy key, no request is sent by these tests."""
+    client = OpenAIClient(api_key="test")
+    yield client
+    client.close()
+
+
+class TestFindClosingBrace:
+    """Tests of _find_closing_brace."""
+
+    def test_flat_dictionary(self):
+        text = 'x = {"a": 1}'
+        assert _find_closing_brace(text, text.index("{")) == len(text) - 1
+
+    def test_nested_dictionaries(self):
+        text = '{"a": {"b": {"c": 1}}, "d": 2} + 1'
+        assert _find_closing_brace(text, 0) == text.index("} + 1")
+
+    def test_braces_in_quoted_strings(self):
+        text = """{"open": "{", 'close': '}', "escaped": "\\"}"}"""
+        assert _find_closing_brace(text, 0) == len(text) - 1
+
+    def test_braces_in_triple_quoted_string(self):
+        text = '{"a": """b"{c""", "d": 1}'
+        assert _find_closing_brace(text, 0) == len(text) - 1
+
+    def test_apostrophe_in_comment(self):
+        text = '{\n    "a": 1,  # it\'s {the} first key\n    "b": 2,\n}\nrest = "}"'
+        assert _find_closing_brace(text, 0) == text.index("}\nrest")
+
+    def test_multi_line_dictionary(self):
+        text = 'expected_output = {\n    "a": [1, 2],\n    "b": {"c": "}"},\n}\n'
+        assert text[_find_closing_brace(text, text.index("{")):] == "}\n"
+
+    @pytest.mark.parametrize("text", ['{"a": 1', '{"a": "}"', '{"a": 1  # }'])
+    def test_unbalanced(self, text):
+        assert _find_closing_brace(text, 0) is None
+
+
+class TestSplitResponseSections:
+    """Tests of OpenAIClient._split_response_sections."""
+
+    def test_decipher_sections(self, client):
+        content = "# decipher.py\nclass A:\n    pass\n\n# unit_test.py\nimport a\n# explanation\nParses A."
+        sections, missing_marker = client._split_response_sections(content)
+        assert missing_marker is None
+        assert sections == ("class A:\n    pass", "import a", "Parses A.")
+
+    def test_text_before_first_marker_is_dropped(self, client):
+        content = "Here is the fix:\n# fixed_code\nx = 1\n# explanation\nDone"
+        assert client._split_response_sections(content, PYLINT_FIX_MARKERS) == (("x = 1", "Done"), None)
+
+    def test_missing_marker(self, client):
+        content = "# decipher.py\nclass A:\n    pass\n# explanation\nParses A."
+        assert client._split_response_sections(content) == (None, "# unit_test.py")
+
+    def test_markers_out_of_order(self, client):
+        content = "# unit_test.py\nimport a\n# decipher.py\nclass A:\n    pass\n# explanation\nParses A."
+        assert client._split_response_sections(content) == (None, "# unit_test.py")
+
+    def test_repeated_marker(self, client):
+        content = "# fixed_code\nx = 1\n# fixed_code\nx = 2\n# explanation\nDone"
+        assert client._split_response_sections(content, PYLINT_FIX_MARKERS) == (None, "# fixed_code")
+
+
+class TestExtractJsonExample:
+    """Tests of OpenAIClient._extract_json_example."""
+
+    def test_single_line_json_string(self, client):
+        content = 'import json\nexpected_output = \'{"a": 1, "b": ["x"]}\'\n'
+        assert client._extract_json_example(content, "unit_test.py") == {"a": 1, "b": ["x"]}
+
+    def test_multi_line_dictionary(self, client):
+        content = 'expected_output = {\n    "a": 1,\n    "b": {"c": [1, 2]},\n}\n\ndef test_a():\n    pass\n'
+        assert client._extract_json_example(content, "unit_test.py") == {"a": 1, "b": {"c": [1, 2]}}
+
+    def test_quoted_braces(self, client):
+        content = 'expected_output = {"open": "{", "close": "}"}\n'
+        assert client._extract_json_example(content, "unit_test.py") == {"open": "{", "close": "}"}
+
+    def test_comment_with_apostrophe(self, client):
+        content = 'expected_output = {\n    "a": 1,  # it\'s the first key\n    "b": "}",\n}\n'
+        assert client._extract_json_example(content, "unit_test.py") == {"a": 1, "b": "}"}
+
+    def test_multi_line_string(self, client):
+        content = 'expected_output = """{\n    "a": 1\n}"""\n'
+        assert client._extract_json_example(content, "unit_test.py") == {"a": 1}
+
+    def test_nested_assignment(self, client):
+        content = 'class TestA:\n    def test_a(self):\n        expected_output = \'{"a": 1}\'\n'
+        assert client._extract_json_example(content, "unit_test.py") == {"a": 1}
+
+    def test_docstring_line_is_ignored(self, client):
+        content = '"""\nexpected_output = {"bogus": 1}\n"""\nexpected_output = \'{"real": 2}\'\n'
+        assert client._extract_json_example(content, "unit_test.py") == {"real": 2}
+
+    def test_invalid_module_level_json_falls_back(self, client):
+        content = 'expected_output = \'not json\'\n\ndef test_a():\n    expected_output = \'{"a": 1}\'\n'
+        assert client._extract_json_example(content, "unit_test.py") == {"a": 1}
+
+    def test_missing_assignment(self, client):
+        assert client._extract_json_example("def test_a():\n    pass\n", "unit_test.py") is None